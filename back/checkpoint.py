@@ -0,0 +1,188 @@
+import json
+import os
+import numpy as np
+from typing import *
+
+from back.qtable import DenseQTable
+from back.utils import code_to_state
+
+FORMAT_VERSION = 1
+
+# learning parameters and flags of `QAgent` saved with its Q-function
+AGENT_ATTRIBUTES = (
+    "_gamma",
+    "_alpha",
+    "_epsilon",
+    "_num_actions",
+    "symmetric",
+    "masked_actions",
+    "num_misses",
+    "trace_decay",
+)
+
+
+def _player_snapshot(player, prefix: str, arrays: dict):
+    """Copy the Q-function and the sampler buffer of a player in `arrays` and return
+    the other attributes to save."""
+    qfunction = player.qfunction
+    if isinstance(qfunction, DenseQTable):
+        arrays[f"{prefix}/values"] = np.array(qfunction.values)
+        arrays[f"{prefix}/visited"] = np.array(qfunction.visited)
+    else:
+        states = list(qfunction)
+        if not all(isinstance(state, str) for state in states):
+            raise ValueError("checkpoints only support Q-functions of 3x3 tic tac toe")
+        arrays[f"{prefix}/codes"] = np.array(
+            [int(state, 3) for state in states], dtype=np.int64
+        )
+        arrays[f"{prefix}/values"] = np.array(
+            [qfunction[state] for state in states], dtype=float
+        ).reshape(len(states), -1)
+    meta = {name: getattr(player, name) for name in AGENT_ATTRIBUTES}
+    meta["dense"] = isinstance(qfunction, DenseQTable)
+    sampler = getattr(player, "sampler", None)
+    if sampler is not None:
+        state = sampler.get_state()
+        arrays[f"{prefix}/sampler_buffer"] = np.array(state["buffer"], dtype=float)
+        meta["sampler"] = {
+            "bit_generator": state["bit_generator"],
+            "position": state["position"],
+        }
+    return meta
+
+
+def snapshot(episode: int, players: Sequence, metrics: dict = None):
+    """Snapshot of a training, taken between two episodes.
+
+    Arrays are copied, so the snapshot can be written while the training goes on.
+
+    Args:
+        episode (int): number of training episodes already played
+        players (Sequence): players of the training. Only players with a `qfunction`
+                            (e.g. `QAgent`) are saved.
+        metrics (dict, optional): metrics of the training: lists `episodes`, `all_rewards`
+                            and `winners` kept in memory by `train`, and/or `metrics_size`
+                            (size in bytes of the metrics log). Defaults to None.
+
+    Returns:
+        dict: `arrays` (dictionary of numpy arrays) and `meta` (json serializable dictionary)
+    """
+    rng_name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    arrays = {"rng/keys": np.array(keys)}
+    meta = {
+        "version": FORMAT_VERSION,
+        "episode": episode,
+        "rng": [rng_name, int(position), int(has_gauss), float(cached_gaussian)],
+        "players": {},
+        "metrics": {},
+    }
+    for p, player in enumerate(players):
+        if getattr(player, "qfunction", None) is not None:
+            prefix = f"player{p + 1}"
+            meta["players"][prefix] = _player_snapshot(player, prefix, arrays)
+
+    metrics = metrics or {}
+    if "metrics_size" in metrics:
+        meta["metrics"]["metrics_size"] = metrics["metrics_size"]
+    if "episodes" in metrics:
+        meta["metrics"]["episodes"] = list(map(int, metrics["episodes"]))
+        arrays["metrics/all_rewards"] = np.array(metrics["all_rewards"], dtype=float)
+        arrays["metrics/winners"] = np.array(metrics["winners"], dtype=np.int64)
+    return {"arrays": arrays, "meta": meta}
+
+
+def write_checkpoint(checkpoint: dict, path: str):
+    """Write a snapshot in an uncompressed `npz` file (the metadata are stored as json).
+
+    Args:
+        checkpoint (dict): snapshot given by `snapshot`
+        path (str): path of the checkpoint file
+    """
+    with open(path, "wb") as checkpoint_file:
+        np.savez(
+            checkpoint_file,
+            meta=np.array(json.dumps(checkpoint["meta"])),
+            **checkpoint["arrays"],
+        )
+
+
+def load_checkpoint(path: str):
+    """Load a checkpoint written by `write_checkpoint`.
+
+    Args:
+        path (str): path of the checkpoint file
+
+    Raises:
+        ValueError: raise Error if the file was written with another format version
+
+    Returns:
+        dict: `arrays` (dictionary of numpy arrays) and `meta` (dictionary)
+    """
+    with np.load(path, allow_pickle=False) as content:
+        arrays = {name: content[name] for name in content.files if name != "meta"}
+        meta = json.loads(str(content["meta"]))
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"{path} has an unknown checkpoint version")
+    return {"arrays": arrays, "meta": meta}
+
+
+def restore(checkpoint: dict, players: Sequence, metrics_path: str = None):
+    """Restore a training from a checkpoint: Q-functions and parameters of the players,
+    global `np.random` state and samplers states.
+
+    Args:
+        checkpoint (dict): checkpoint given by `load_checkpoint`
+        players (Sequence): players of the training, updated in place
+        metrics_path (str, optional): metrics log of the training. Defaults to None. If it
+                            is given, rows written after the checkpoint are removed.
+
+    Returns:
+        tuple[int, dict]: number of training episodes already played and metrics saved in
+                            the checkpoint (`episodes`, `all_rewards` and `winners` lists if
+                            they were kept in memory)
+    """
+    arrays, meta = checkpoint["arrays"], checkpoint["meta"]
+    for p, player in enumerate(players):
+        prefix = f"player{p + 1}"
+        if prefix not in meta["players"]:
+            continue
+        player_meta = meta["players"][prefix]
+        for name in AGENT_ATTRIBUTES:
+            setattr(player, name, player_meta[name])
+        if player_meta["dense"]:
+            player.qfunction = DenseQTable(
+                arrays[f"{prefix}/values"].copy(), arrays[f"{prefix}/visited"].copy()
+            )
+        else:
+            player.qfunction = {
+                code_to_state(int(code)): qvalue.copy()
+                for code, qvalue in zip(
+                    arrays[f"{prefix}/codes"], arrays[f"{prefix}/values"]
+                )
+            }
+        player._policies, player._dirty_states = {}, {}
+        player._clear_traces()
+        if "sampler" in player_meta and getattr(player, "sampler", None) is not None:
+            player.sampler.set_state(
+                {
+                    "bit_generator": player_meta["sampler"]["bit_generator"],
+                    "buffer": arrays[f"{prefix}/sampler_buffer"].tolist(),
+                    "position": player_meta["sampler"]["position"],
+                }
+            )
+
+    rng_name, position, has_gauss, cached_gaussian = meta["rng"]
+    np.random.set_state(
+        (rng_name, arrays["rng/keys"], position, has_gauss, cached_gaussian)
+    )
+
+    metrics = {}
+    if "metrics_size" in meta["metrics"] and metrics_path is not None:
+        if os.path.exists(metrics_path):
+            with open(metrics_path, "r+b") as log_file:
+                log_file.truncate(meta["metrics"]["metrics_size"])
+    if "episodes" in meta["metrics"]:
+        metrics["episodes"] = list(meta["metrics"]["episodes"])
+        metrics["all_rewards"] = list(arrays["metrics/all_rewards"])
+        metrics["winners"] = arrays["metrics/winners"].tolist()
+    return meta["episode"], metrics
@@ -0,0 +1,152 @@
+import contextlib
+import cProfile
+import csv
+from collections import defaultdict
+from typing import *
+
+
+def table_size(player):
+    """Number of states in the Q-function of a player (0 if it has none)."""
+    qfunction = getattr(player, "qfunction", None)
+    return len(qfunction) if qfunction is not None else 0
+
+
+def num_misses(player):
+    """Number of Q-function misses of a player (0 if it does not count them)."""
+    return getattr(player, "num_misses", 0)
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        """Timers and counters filled by `run_episode` and `train` when an instance is given.
+
+        - `timers`: total time (in seconds) spent in each phase (`act`, `step`, `update`,
+          `evaluation`)
+        - `counters`: number of episodes, steps, illegal moves and, for each player,
+          Q-function misses and insertions
+        - `episode_lengths`: number of episodes of each length (number of steps)
+        - `table_sizes`: `(episode, size of player1's table, size of player2's table)`
+          recorded by `train` at each evaluation
+        """
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.episode_lengths = defaultdict(int)
+        self.table_sizes = []
+
+    def add_time(self, phase: str, seconds: float):
+        """Add time spent in a phase.
+
+        Args:
+            phase (str): name of the phase
+            seconds (float): time spent
+        """
+        self.timers[phase] += seconds
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter.
+
+        Args:
+            name (str): name of the counter
+            n (int, optional): increment. Defaults to 1.
+        """
+        self.counters[name] += n
+
+    def start_episode(self, players: Sequence):
+        """Snapshot of the tables of the players at the beginning of an episode.
+
+        Args:
+            players (Sequence): players of the episode
+
+        Returns:
+            list[tuple[int, int]]: number of misses and table size of each player
+        """
+        return [(num_misses(player), table_size(player)) for player in players]
+
+    def end_episode(self, players: Sequence, snapshot: list, n_steps: int):
+        """Record an episode.
+
+        Args:
+            players (Sequence): players of the episode
+            snapshot (list): value returned by `start_episode` for this episode
+            n_steps (int): length of the episode
+        """
+        self.counters["episodes"] += 1
+        self.counters["steps"] += n_steps
+        self.episode_lengths[n_steps] += 1
+        for p, (player, (misses, size)) in enumerate(zip(players, snapshot)):
+            self.counters[f"q_misses/player{p + 1}"] += num_misses(player) - misses
+            self.counters[f"q_insertions/player{p + 1}"] += table_size(player) - size
+
+    def record_tables(self, episode: int, players: Sequence):
+        """Record the size of the tables of the players.
+
+        Args:
+            episode (int): current episode
+            players (Sequence): players whose table sizes are recorded
+        """
+        self.table_sizes.append((episode, *(table_size(player) for player in players)))
+
+    def summary(self):
+        """Summary of the recorded timers and counters.
+
+        Returns:
+            dict: flat dictionary with `time/<phase>`, `time_share/<phase>` (fraction of the
+                    timed phases), counters, `episode_length/mean`, `episode_length/max` and
+                    the last recorded `table_size/player<n>`
+        """
+        summary = {}
+        total_time = sum(self.timers.values())
+        for phase, seconds in self.timers.items():
+            summary[f"time/{phase}"] = seconds
+        for phase, seconds in self.timers.items():
+            summary[f"time_share/{phase}"] = seconds / total_time if total_time else 0.0
+        summary.update(self.counters)
+        if self.episode_lengths:
+            num_episodes = sum(self.episode_lengths.values())
+            summary["episode_length/mean"] = (
+                sum(length * n for length, n in self.episode_lengths.items())
+                / num_episodes
+            )
+            summary["episode_length/max"] = max(self.episode_lengths)
+        if self.table_sizes:
+            for p, size in enumerate(self.table_sizes[-1][1:]):
+                summary[f"table_size/player{p + 1}"] = size
+        return summary
+
+    def to_csv(self, path: str):
+        """Save the summary in a csv file with `name,value` rows.
+
+        Args:
+            path (str): path of the csv file
+        """
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(("name", "value"))
+            writer.writerows(self.summary().items())
+
+
+def profiled(path: str = None):
+    """Context manager running its block under `cProfile` and dumping the statistics
+    in a `pstats` file (readable with `python -m pstats <path>`).
+
+    Args:
+        path (str, optional): path of the statistics file. Defaults to None.
+                                If None is given, nothing is profiled.
+
+    Returns:
+        contextlib.AbstractContextManager: the context manager
+    """
+    if path is None:
+        return contextlib.nullcontext()
+    return _profiled(path)
+
+
+@contextlib.contextmanager
+def _profiled(path: str):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
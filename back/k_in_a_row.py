@@ -0,0 +1,202 @@
+import copy
+from typing import *
+
+from back.utils import code_to_cells
+
+# directions of the lines through a cell: row, column, diagonal, antidiagonal
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class KInARow:
+    def __init__(self, size: int = 3, k: int = 3) -> None:
+        """Generate a `size x size` game environment where a player wins by aligning `k` marks
+        in a row, a column or a diagonal. `KInARow(3, 3)` follows exactly the rules and rewards
+        of `TicTacToe`.
+
+        Only the lines through the last move are checked, so a move costs `O(k)` whatever
+        the size of the board. The state is encoded by an integer code (base-3 number of the
+        cells, the first cell being the most significant digit) updated after each move;
+        for `3 x 3` boards it is the code of the `TicTacToe` hashed state.
+
+        Args:
+            size (int, optional): number of rows and columns. Defaults to 3.
+            k (int, optional): number of aligned marks needed to win. Defaults to 3.
+
+        Raises:
+            ValueError: raise Error if `k` is not between 1 and `size`
+        """
+        if not 1 <= k <= size:
+            raise ValueError(f"k must be between 1 and {size}")
+        self.size = size
+        self.k = k
+        self.num_actions = size * size
+        self.actions = {action: divmod(action, size) for action in range(size * size)}
+        # weight of each cell in the state code
+        self._weights = [
+            3 ** (self.num_actions - 1 - cell) for cell in range(size * size)
+        ]
+        self.reset()
+
+    def whose_turn(self):
+        """Ask the environment the index of current player
+
+        Returns:
+            int: index of current player
+        """
+        return 0 if self.val == 1 else 1
+
+    def _run_length(self, row: int, col: int, d_row: int, d_col: int):
+        """Cells of the current player aligned with the given cell in one direction (the given
+        cell excluded)."""
+        cells = []
+        row, col = row + d_row, col + d_col
+        while 0 <= row < self.size and 0 <= col < self.size:
+            cell = row * self.size + col
+            if self.cells[cell] != self.val:
+                break
+            cells.append(cell)
+            row, col = row + d_row, col + d_col
+        return cells
+
+    def get_reward(self, action: int):
+        """Check wether the game is ended after current player played at the given cell and return the respected reward.
+
+        Args:
+            action (int): index of the cell where player played
+
+        Returns:
+            int: reward obtain by playing at the given position (one for each completed line)
+        """
+        row, col = self.actions[action]
+        reward = 0
+        if self.number_of_empty == 0:
+            self.end = True
+            self.winner = None
+        for d_row, d_col in DIRECTIONS:
+            line = (
+                self._run_length(row, col, d_row, d_col)
+                + [action]
+                + self._run_length(row, col, -d_row, -d_col)
+            )
+            if len(line) >= self.k:
+                self.color.append(self.val)
+                self.winning_cells.update(line)
+                self.end = True
+                self.winner = self.whose_turn()
+                reward += 1
+        return reward
+
+    def play_action(self, action: int):
+        """Current player plays at the given cell.
+
+        Args:
+            action (int): index of the cell where player want to play
+
+        Returns:
+            tuple[bool, int]: indication wether player was able to play at the given position, reward obtain by trying to play on the position
+        """
+        if self.end:
+            return False, -sum(self.color)
+        if self.cells[action] != 0:
+            return False, -1  # penalize on typing on filled slot
+
+        self.cells[action] = self.val
+        self.state_code += self._weights[action] * (1 if self.val == 1 else 2)
+        self.number_of_empty -= 1
+        reward = self.get_reward(action)
+        # switch player
+        self.val *= -1
+        return True, reward
+
+    def play(self, row: int, col: int):
+        """Current player plays at the given row and column.
+
+        Args:
+            row (int): row where player want to play
+            col (int): column where player want to play
+
+        Returns:
+            tuple[bool, int]: indication wether player was able to play at the given position, reward obtain by trying to play on the position
+        """
+        return self.play_action(row * self.size + col)
+
+    def legal_actions(self):
+        """Allowed actions of current player (none if the game is over).
+
+        Returns:
+            tuple[int]: allowed actions
+        """
+        if self.end:
+            return ()
+        return tuple(action for action, cell in enumerate(self.cells) if cell == 0)
+
+    @property
+    def board(self):
+        """Board as a list of rows with 1 for player 1, -1 for player 2 and 0 for empty cells."""
+        return [
+            self.cells[row * self.size : (row + 1) * self.size]
+            for row in range(self.size)
+        ]
+
+    @property
+    def hashed_state(self):
+        """Integer code of the current state (`cells_of` gives back its cells).
+
+        Returns:
+            int : code of the current state
+        """
+        return self.state_code
+
+    def cells_of(self, state: int):
+        """Cells (0 for empty, 1 for player 1 and 2 for player 2) of a state code.
+
+        Args:
+            state (int): code of a state
+
+        Returns:
+            list[int]: cells of the state
+        """
+        return code_to_cells(state, self.num_actions)
+
+    def clone(self):
+        """Independent copy of the environment (e.g. to simulate games from the current state).
+
+        Returns:
+            KInARow: the copy
+        """
+        environment = copy.copy(self)
+        environment.cells = list(self.cells)
+        environment.color = list(self.color)
+        environment.winning_cells = set(self.winning_cells)
+        return environment
+
+    def reset(self):
+        """Reset environement:
+        - Set hand to plalyer 1
+        - Clear and uncolor the board
+
+        Returns:
+            int : code of the empty state
+        """
+        self.val = 1
+        self.cells = [0] * self.num_actions
+        self.state_code = 0
+        self.number_of_empty = self.num_actions
+        self.color = []  # value of the player of each completed line
+        self.winning_cells = set()
+        self.end = False
+        self.winner = None
+        return self.hashed_state
+
+    def step(self, action: int):
+        """Make a step in the environement by performing an action.
+        Actions are the index of the cells (`row * size + col`).
+
+        Args:
+            action (int): index of the action to perform.
+
+        Returns:
+            tuple[int, int, bool, bool]: code of next state, reward from the action, indication if the game is done, indication if the player will be switched
+        """
+        switch, reward = self.play_action(action)
+        return self.hashed_state, reward, self.end, switch
@@ -0,0 +1,152 @@
+import csv
+import math
+import numpy as np
+from typing import *
+
+COLUMNS = (
+    "episode",
+    "num_eval_episodes",
+    "reward1",
+    "reward2",
+    "draws",
+    "wins1",
+    "wins2",
+)
+
+
+class MetricsLog:
+    def __init__(self, path: str) -> None:
+        """Append-only csv log of the evaluations made during a training.
+
+        Each row holds the training episode, the number of evaluation episodes, the average
+        reward of both players and the number of draws and wins of both players. Rows are
+        written as soon as they are appended, so the log can be read during the training
+        and nothing is kept in memory. An existing log is continued.
+
+        Args:
+            path (str): path of the csv file
+        """
+        self.path = path
+        with open(path, "a+", newline="") as log_file:
+            log_file.seek(0)
+            is_empty = not log_file.read(1)
+            if is_empty:
+                csv.writer(log_file).writerow(COLUMNS)
+        self._file = open(path, "a", newline="", buffering=1)
+        self._writer = csv.writer(self._file)
+
+    def append(
+        self,
+        episode: int,
+        num_eval_episodes: int,
+        rewards: Sequence[float],
+        winners: Sequence[int],
+    ):
+        """Append the result of an evaluation.
+
+        Args:
+            episode (int): training episode of the evaluation
+            num_eval_episodes (int): number of episodes of the evaluation
+            rewards (Sequence[float]): average reward of player1 and player2
+            winners (Sequence[int]): number of [draw, player1 wins, player2 wins]
+
+        Raises:
+            ValueError: raise Error if there are not 2 rewards and 3 winner counts
+        """
+        if len(rewards) != 2 or len(winners) != 3:
+            raise ValueError("expected 2 rewards and 3 winner counts")
+        self._writer.writerow(
+            (episode, num_eval_episodes, *map(float, rewards), *map(int, winners))
+        )
+
+    @property
+    def size(self):
+        """Size in bytes of the written log."""
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def iter_metrics(path: str):
+    """Iterate lazily over the rows of a metrics log.
+
+    Args:
+        path (str): path of the csv file
+
+    Yields:
+        tuple: `episode`, `num_eval_episodes`, `reward1`, `reward2`, `draws`, `wins1`, `wins2`
+    """
+    with open(path, "r", newline="") as log_file:
+        reader = csv.reader(log_file)
+        next(reader, None)  # header
+        for row in reader:
+            if len(row) == len(COLUMNS):  # skip a row being written
+                yield (int(row[0]), int(row[1]), *map(float, row[2:]))
+
+
+def read_metrics(
+    path: str,
+    max_points: int = None,
+    from_episode: int = 0,
+    end_episode: int = None,
+):
+    """Read a metrics log in the format returned by `train`, optionally downsampled.
+
+    Only the downsampled points are kept in memory: consecutive rows are averaged
+    by buckets, each point being placed at the last episode of its bucket.
+
+    Args:
+        path (str): path of the csv file
+        max_points (int, optional): maximum number of points. Defaults to None.
+                                    If None is given, every row is returned.
+        from_episode (int, optional): first training episode to read. Defaults to 0.
+        end_episode (int, optional): training episode where to stop reading (excluded).
+                                    Defaults to None (read until the end).
+
+    Returns:
+        tuple[list, np.ndarray, np.ndarray, int]: - list of episodes number of the points
+                                    - `2xn` array of average reward of both players
+                                    - `3xn` array of average number of [draw, player1 wins, player2 wins]
+                                    - number of evaluation episodes (of the last row)
+    """
+
+    def rows():
+        for row in iter_metrics(path):
+            if row[0] < from_episode:
+                continue
+            if end_episode is not None and row[0] >= end_episode:
+                break
+            yield row
+
+    bucket_size = 1
+    if max_points is not None:
+        num_rows = sum(1 for _ in rows())
+        bucket_size = max(1, math.ceil(num_rows / max_points))
+
+    episodes, points = [], []
+    num_eval_episodes = 0
+    bucket = np.zeros(len(COLUMNS) - 2)
+    count = 0
+    for row in rows():
+        bucket += row[2:]
+        count += 1
+        if count == bucket_size:
+            episodes.append(row[0])
+            points.append(bucket / count)
+            bucket[:] = 0
+            count = 0
+        num_eval_episodes = row[1]
+    if count:
+        episodes.append(row[0])
+        points.append(bucket / count)
+
+    points = np.array(points).reshape(-1, len(COLUMNS) - 2).T
+    return episodes, points[:2], points[2:], num_eval_episodes
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+import time
+from typing import *
+
+from back.utils import generate_json
+
+
+class PersistenceService:
+    def __init__(self, delay: float = 1.0) -> None:
+        """Background service saving files on a worker thread.
+
+        Saves are queued by path: a new save of a path replaces the pending one,
+        and pending saves are written once no new save has been queued for `delay`
+        seconds. Files are written to a temporary file which is then renamed, so a
+        file is never left half written.
+
+        Args:
+            delay (float, optional): debounce delay in seconds. Defaults to 1.0.
+        """
+        self.delay = delay
+        self._pending = {}
+        self._deadline = 0.0
+        self._writing = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        path: str,
+        producer: Callable[[], Any],
+        writer: Callable[[Any, str], None] = generate_json,
+    ):
+        """Queue a save of `path`.
+
+        Args:
+            path (str): path of the file to save
+            producer (Callable[[], Any]): function called on the worker thread which returns
+                                        the data to save. It should not share mutable data
+                                        with the caller (e.g. use a snapshot).
+            writer (Callable[[Any, str], None], optional): function writing the data in a given path.
+                                        Defaults to `generate_json`.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("the persistence service is closed")
+            self._pending[path] = (producer, writer)
+            self._deadline = time.monotonic() + self.delay
+            self._condition.notify_all()
+
+    def flush(self):
+        """Write all pending saves now and wait until they are written."""
+        with self._condition:
+            self._deadline = 0.0
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        """Flush pending saves and stop the worker thread."""
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    remaining = self._deadline - time.monotonic()
+                    if self._pending and remaining <= 0:
+                        break
+                    self._condition.wait(remaining if self._pending else None)
+                if not self._pending:
+                    return
+                jobs, self._pending = self._pending, {}
+                self._writing = True
+            for path, (producer, writer) in jobs.items():
+                self._write(path, producer, writer)
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    @staticmethod
+    def _write(path: str, producer: Callable[[], Any], writer: Callable):
+        """Write a file atomically through a temporary file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(descriptor)
+        try:
+            writer(producer(), tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception as error:
+            print(f"Failed to save {path}: {error}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -1,7 +1,30 @@
+import copy
+import math
+import os
+import time
 import numpy as np
 from typing import *
 
-from back.utils import return_probabilities, generate_json, argmax_uniform
+from back.utils import (
+    return_probabilities,
+    return_probabilities_batch,
+    states_to_matrix,
+    NUM_CELLS,
+    code_to_cells,
+    code_to_state,
+    generate_json,
+    argmax_uniform,
+)
+from back.qtable import DenseQTable, INITIAL_VALUES, LEGAL_MASK, STATE_CODE_WEIGHTS
+from back.storage import save_table, patch_table
+from back.state_graph import get_state_graph
+from back.sampler import Sampler, CumulativePolicy, cumulative
+from back.symmetry import (
+    canonicalize,
+    to_canonical_action,
+    from_canonical_action,
+    expand_policy,
+)
 
 
 class Player:
@@ -88,9 +111,17 @@ class QAgent(Player):
         learning_rate: float,
         epsilon: float,
         qfunction: dict = None,
+        dense: bool = False,
+        symmetric: bool = False,
+        masked_actions: bool = False,
+        sampler: Sampler = None,
+        trace_decay: float = 0.0,
     ) -> None:
         """A free tabular Q-agent class for Tic Tac Toe player
 
+        States are hashed states (strings) or, on boards other than 3x3 (see `KInARow`),
+        integer state codes. Dense tables and symmetries only support 3x3 boards.
+
         Args:
             num_actions (int): the total number of actions for the environment
             gamma (float): discount factor (between 0 to 1, 1 excluded from theory).
@@ -100,9 +131,34 @@ class QAgent(Player):
             epsilon (float): probability of acting non greedily (from 0 to 1). The higher epsilon is,
                             the more the agent explore.
             qfunction (dict): Q-value function of each state at each action. Default to None.
+            dense (bool, optional): flag saying wether the Q-function is stored in a `DenseQTable`
+                            (one contiguous array indexed by state codes) instead of a dictionary.
+                            Defaults to False.
+            symmetric (bool, optional): flag saying wether states are canonicalized among their
+                            rotations and reflections. If it is set to `True`, the `qfunction` (and the
+                            generated policies) will only contain canonical states. Defaults to False.
+            masked_actions (bool, optional): flag saying wether exploration and greedy actions are
+                            restricted to allowed actions (empty cells). Defaults to False.
+            sampler (Sampler, optional): sampler of the random numbers used to act. Defaults to None.
+                            If None is given, the global `np.random` generator is used.
+            trace_decay (float, optional): decay `lambda` of the eligibility traces (from 0 to 1) of
+                            Watkins's Q(lambda). With a positive value, each update also updates the
+                            previous state-action pairs of the episode (since the last exploratory
+                            action), so rewards propagate back faster. Defaults to 0 (one-step Q-learning).
         """
         self.set_learning_params(gamma, learning_rate, epsilon)
+        self.symmetric = symmetric
+        self.masked_actions = masked_actions
+        self.sampler = sampler
+        self.num_misses = 0  # lookups of states which were not in the Q-function
+        self.trace_decay = trace_decay
+        self._clear_traces()
+        self._policies = {}  # policies kept up to date by incremental generation
+        # states updated since the last generation of each policy
+        self._dirty_states = {}
         self.qfunction = qfunction if qfunction is not None else {}
+        if dense and not isinstance(self.qfunction, DenseQTable):
+            self.qfunction = DenseQTable.from_dict(self.qfunction)
         self._num_actions = num_actions
 
     def set_learning_params(
@@ -127,6 +183,66 @@ class QAgent(Player):
         if epsilon is not None:
             self._epsilon = epsilon
 
+    def qvalue(self, state: str, kind: str = "random"):
+        """Q-value at a given state. If the state is not in the `qfunction` yet, it is
+        added with the probabilities of `kind` on a zero Q-value.
+
+        Args:
+            state (str): state where to get the Q-value
+            kind (str, optional): one of the strings `'random'`, `'greedy'` or `'softmax'`
+                                    used to initialize the Q-value. Defaults to `'random'`.
+
+        Returns:
+            np.ndarray: Q-value at the given state (updating it updates the `qfunction`)
+        """
+        if isinstance(self.qfunction, DenseQTable):  # every state is already there
+            code = self.qfunction.code(state)
+            if not self.qfunction.visited[code]:
+                self.num_misses += 1
+                if self._dirty_states:
+                    self._mark_dirty(state)
+            return self.qfunction[code]
+        if state not in self.qfunction:
+            self.num_misses += 1
+            self.qfunction[state] = self._initial_qvalue(state, kind)
+            self._mark_dirty(state)
+        return self.qfunction[state]
+
+    def _initial_qvalue(self, state: str, kind: str = "random"):
+        """Probabilities of `kind` on a zero Q-value, i.e. uniform on allowed actions.
+
+        For Tic Tac Toe states, they are read from the precomputed `INITIAL_VALUES`
+        instead of parsing the state.
+        """
+        if self._num_actions == NUM_CELLS and isinstance(state, str):
+            return INITIAL_VALUES[int(state, 3)].copy()
+        return np.array(
+            return_probabilities(self._cells(state), np.zeros(self._num_actions), kind)
+        )
+
+    def _cells(self, state: Union[str, int]):
+        """Cells of a hashed state or of an integer state code (e.g. of `KInARow`)."""
+        if isinstance(state, str):
+            return [int(char) for char in state]
+        return code_to_cells(state, self._num_actions)
+
+    def _mark_dirty(self, state: str):
+        """Mark a state to be regenerated by the next incremental policy generations."""
+        for dirty_states in self._dirty_states.values():
+            dirty_states.add(state)
+
+    def _uniform(self):
+        """Uniform sample in `[0, 1)` from the sampler, or from `np.random` if there is none."""
+        if self.sampler is None:
+            return np.random.uniform()
+        return self.sampler.uniform()
+
+    def _randint(self, n: int):
+        """Uniform integer in `[0, n)` from the sampler, or from `np.random` if there is none."""
+        if self.sampler is None:
+            return np.random.randint(n)
+        return self.sampler.integers(n)
+
     def act(self, state: str, eval: bool = False, policy: dict = None):
         """Sample action at a given state
 
@@ -137,32 +253,118 @@ class QAgent(Player):
                                     done greedily (if `eval` is set to `True`) or epsilon-greedy. Defaults to False.
             policy (dict, optional): a dictionary policy to use if it is not None. Default to None. If policy is given
                                     then eval will be ignored. If the given state is not available in the policy, action
-                                    will be choosen uniformly from all allowed move.
+                                    will be choosen uniformly from all allowed move. For a `symmetric` agent, the policy
+                                    is looked up at the canonical state.
 
         Returns:
             int: a sample action at the given state.
         """
-        if policy is not None and isinstance(policy, dict):
+        if self.symmetric:
+            state, transform = canonicalize(state)
+
+        sampler = self.sampler
+        if policy is not None and isinstance(policy, Mapping):
             if state in policy:
                 proba = policy[state]
             else:
-                proba = return_probabilities(
-                    state, np.zeros(self._num_actions), "random"
-                )
-            action = np.random.choice(np.arange(self._num_actions), p=proba)
-            return action
-
-        if state not in self.qfunction:
-            self.qfunction[state] = np.array(
-                return_probabilities(state, np.zeros(self._num_actions), "random")
-            )
-
-        if eval or np.random.uniform() > self._epsilon:
-            action = argmax_uniform(self.qfunction[state])  # grab argmax uniformely
+                self.num_misses += 1
+                proba = self._initial_qvalue(state)
+            if sampler is None:
+                action = np.random.choice(np.arange(self._num_actions), p=proba)
+            elif isinstance(policy, CumulativePolicy) and state in policy:
+                action = sampler.categorical(policy.cdf(state))
+            else:
+                action = sampler.categorical(cumulative(proba))
         else:
-            action = np.random.randint(self._num_actions)
+            qvalue = self.qvalue(state)
+            legal_actions = self._legal_actions(state) if self.masked_actions else ()
+            if legal_actions:
+                if eval or self._uniform() > self._epsilon:
+                    action = legal_actions[
+                        argmax_uniform(qvalue[list(legal_actions)], sampler)
+                    ]
+                else:
+                    action = legal_actions[self._randint(len(legal_actions))]
+            elif eval or self._uniform() > self._epsilon:
+                action = argmax_uniform(qvalue, sampler)  # grab argmax uniformely
+            else:
+                action = self._randint(self._num_actions)
+
+        if self.symmetric:
+            action = from_canonical_action(action, transform)
         return action
 
+    def _legal_actions(self, state: str):
+        """Allowed actions at a state, none if the game is over at this state."""
+        if self._num_actions == NUM_CELLS and isinstance(state, str):
+            return get_state_graph().legal_actions(state)
+        return tuple(
+            action for action, cell in enumerate(self._cells(state)) if cell == 0
+        )
+
+    @property
+    def batched(self):
+        """Flag saying wether the agent can act and learn on many states at once with
+        `act_batch` and `update_batch`, i.e. its Q-function is a `DenseQTable` and it is
+        neither `symmetric` nor using eligibility traces."""
+        return (
+            isinstance(self.qfunction, DenseQTable)
+            and not self.symmetric
+            and not self.trace_decay
+        )
+
+    def _random(self, size: Union[int, tuple]):
+        """Array of uniform samples in `[0, 1)` from the sampler, or from `np.random` if there is none."""
+        if self.sampler is None:
+            return np.random.random(size)
+        return self.sampler.random(size)
+
+    def _visit(self, codes: np.ndarray):
+        """Vectorized counterpart of the lookups of `qvalue` on a dense Q-function:
+        count the misses, mark the states as dirty and list them in the table."""
+        table = self.qfunction
+        if not table.visited.flags.writeable:
+            return
+        missed = np.unique(codes[~table.visited[codes]])
+        self.num_misses += len(missed)
+        if self._dirty_states:
+            for code in missed.tolist():
+                self._mark_dirty(code_to_state(code))
+        table.visited[missed] = True
+
+    def act_batch(self, codes: np.ndarray, eval: bool = False):
+        """Sample actions at many states at once, as `act` does for each of them
+        (only for a `batched` agent).
+
+        Ties of greedy actions are broken uniformly, and exploratory actions are uniform
+        on all actions (allowed actions for a `masked_actions` agent).
+
+        Args:
+            codes (np.ndarray): state codes (see `DenseQTable.code`)
+            eval (bool, optional): a flag saying wether the sampling should be
+                                    done greedily (if `eval` is set to `True`) or epsilon-greedy. Defaults to False.
+
+        Returns:
+            np.ndarray: sampled action at each state
+        """
+        self._visit(codes)
+        qvalues = self.qfunction.values[codes]
+        allowed = np.ones(qvalues.shape, dtype=bool)
+        if self.masked_actions:  # every action on filled boards, as in `act`
+            legal = LEGAL_MASK[codes]
+            allowed = legal | ~legal.any(axis=-1, keepdims=True)
+        qvalues = np.where(allowed, qvalues, -np.inf)
+        is_max = qvalues == qvalues.max(axis=-1, keepdims=True)
+        # the largest uniform sample among the candidates picks one of them uniformly
+        actions = np.where(is_max, self._random(qvalues.shape), -1.0).argmax(axis=-1)
+        if not eval:
+            explore = self._random(len(codes)) <= self._epsilon
+            random_actions = np.where(
+                allowed[explore], self._random(allowed[explore].shape), -1.0
+            ).argmax(axis=-1)
+            actions[explore] = random_actions
+        return actions
+
     def update(
         self, state: str, action: int, next_state: str, reward: int, done: bool
     ) -> None:
@@ -177,25 +379,148 @@ class QAgent(Player):
             reward (int): reward obtained by performing the action at the state
             done (bool): falg saying wether the next state is a terminal state or not
         """
-        if state not in self.qfunction:
-            self.qfunction[state] = np.array(
-                return_probabilities(state, np.zeros(self._num_actions), "random")
+        if self.symmetric:
+            state, transform = canonicalize(state)
+            action = to_canonical_action(action, transform)
+            next_state, _ = canonicalize(next_state)
+
+        qvalue = self.qvalue(state)
+        self._mark_dirty(state)
+        if self.trace_decay:
+            self._update_traces(state, action, qvalue, next_state, reward, done)
+        elif done:
+            qvalue[action] = (1 - self._alpha) * qvalue[action] + self._alpha * reward
+        else:
+            next_qvalue = self.qvalue(next_state, "greedy")
+            qvalue[action] = (1 - self._alpha) * qvalue[action] + self._alpha * (
+                reward + self._gamma * next_qvalue.max()
             )
 
+    def _update_traces(
+        self,
+        state: str,
+        action: int,
+        qvalue: np.ndarray,
+        next_state: str,
+        reward: int,
+        done: bool,
+    ):
+        """Watkins's Q(lambda) update with replacing eligibility traces.
+
+        The traces of the episode are kept in small buffers: the Q-value rows (views on the
+        Q-function) and actions of the visited pairs and their traces. They are cut after an
+        exploratory (non greedy) action, greedy meaning among allowed actions for a
+        `masked_actions` agent as in `act`. They are cleared at the first move of the agent in
+        an episode, so an episode stopped before its end (e.g. by `max_step`) leaves nothing to
+        the next one. A rejected move (on a filled cell) only updates its own pair, and the
+        traces are also cleared after it and at the end of the episode.
+        """
+        rejected = next_state == state
+        legal_actions = self._legal_actions(state) if self.masked_actions else ()
+        greedy_value = (
+            qvalue[list(legal_actions)].max() if legal_actions else qvalue.max()
+        )
+        if rejected or qvalue[action] < greedy_value or self._is_first_move(state):
+            self._clear_traces()  # rejected or exploratory action, or new episode
         if done:
-            self.qfunction[state][action] = (1 - self._alpha) * self.qfunction[state][
-                action
-            ] + self._alpha * reward
+            delta = reward - qvalue[action]
+        else:
+            delta = (
+                reward
+                + self._gamma * self.qvalue(next_state, "greedy").max()
+                - qvalue[action]
+            )
+
+        key = (state, action)
+        if key in self._trace_index:  # replacing trace
+            self._traces[self._trace_index[key]] = 1.0
         else:
-            if next_state not in self.qfunction:
-                self.qfunction[next_state] = np.array(
-                    return_probabilities(
-                        next_state, np.zeros(self._num_actions), "greedy"
-                    )
-                )
-            self.qfunction[state][action] = (1 - self._alpha) * self.qfunction[state][
-                action
-            ] + self._alpha * (reward + self._gamma * self.qfunction[next_state].max())
+            self._trace_index[key] = len(self._traces)
+            self._trace_rows.append(qvalue)
+            self._trace_actions.append(action)
+            self._traces.append(1.0)
+
+        step = self._alpha * delta
+        decay = self._gamma * self.trace_decay
+        for i, (row, row_action) in enumerate(
+            zip(self._trace_rows, self._trace_actions)
+        ):
+            row[row_action] += step * self._traces[i]
+            self._traces[i] *= decay
+        if done or rejected:
+            self._clear_traces()
+
+    def update_batch(
+        self,
+        codes: np.ndarray,
+        actions: np.ndarray,
+        next_codes: np.ndarray,
+        rewards: np.ndarray,
+        dones: np.ndarray,
+    ):
+        """Apply the one-step update of `update` to many transitions at once (only for a
+        `batched` agent).
+
+        All the updates are computed from the Q-values before the call, and if a same state
+        and action appears several times, only its last update is kept.
+
+        Args:
+            codes (np.ndarray): codes of the current states
+            actions (np.ndarray): performed actions
+            next_codes (np.ndarray): codes of the next states
+            rewards (np.ndarray): obtained rewards
+            dones (np.ndarray): flags saying wether the next states are terminal states or not
+        """
+        self._visit(codes)
+        self._visit(next_codes[~dones])
+        values = self.qfunction.values
+        targets = rewards.astype(float)
+        targets[~dones] += self._gamma * values[next_codes[~dones]].max(axis=-1)
+        values[codes, actions] = (1 - self._alpha) * values[
+            codes, actions
+        ] + self._alpha * targets
+        if self._dirty_states:
+            for code in np.unique(codes).tolist():
+                self._mark_dirty(code_to_state(code))
+
+    def _is_first_move(self, state: Union[str, int]):
+        """Flag saying wether a state has at most one mark, i.e. is where the agent makes
+        its first move of an episode."""
+        if isinstance(state, str):
+            return state.count("0") >= len(state) - 1
+        return np.count_nonzero(self._cells(state)) <= 1
+
+    def _clear_traces(self):
+        """Empty the eligibility traces buffers."""
+        self._trace_rows = []
+        self._trace_actions = []
+        self._traces = []
+        self._trace_index = {}
+
+    def copy_qfunction(self):
+        """Copy of the Q-function only (e.g. to save it while the agent keeps learning).
+
+        Returns:
+            dict | DenseQTable: the copied Q-function
+        """
+        if isinstance(self.qfunction, DenseQTable):
+            return self.qfunction.copy()
+        return {state: qvalue.copy() for state, qvalue in self.qfunction.items()}
+
+    def copy(self):
+        """Copy of the agent with its own copy of the Q-function.
+
+        Returns:
+            QAgent: the copied agent
+        """
+        agent = copy.copy(self)
+        agent._clear_traces()
+        agent._policies = {key: dict(policy) for key, policy in self._policies.items()}
+        agent._dirty_states = {
+            key: set(states) for key, states in self._dirty_states.items()
+        }
+        agent.qfunction = self.copy_qfunction()
+        return agent
 
     def save_qfunction(self, json_qfunction_path: str):
         """Save Q function in a json file
@@ -205,24 +530,303 @@ class QAgent(Player):
         """
         generate_json(self.qfunction, json_qfunction_path)
 
-    def generate_policy(self, kind: str, json_policy_path: str = None):
+    def _probabilities(self, states: list, kind: str):
+        """Policy distributions at the given states of the `qfunction`, computed at once
+        with `return_probabilities_batch`.
+
+        Args:
+            states (list): states of the `qfunction`
+            kind (str): one of the strings `'random'`, `'greedy'` or `'softmax'`
+
+        Returns:
+            dict: a dictionary with states as keys and distributions (`list`) as values
+        """
+        if not states:
+            return {}
+        if self._num_actions == NUM_CELLS and isinstance(states[0], str):
+            states_matrix = states_to_matrix(states)
+        else:
+            states_matrix = np.array([self._cells(state) for state in states])
+        if isinstance(self.qfunction, DenseQTable):
+            q_matrix = self.qfunction.values[states_matrix @ STATE_CODE_WEIGHTS]
+        else:
+            q_matrix = np.array([self.qfunction[state] for state in states])
+        probs = return_probabilities_batch(states_matrix, q_matrix, kind)
+        return dict(zip(states, probs.tolist()))
+
+    def generate_policy(
+        self,
+        kind: str,
+        json_policy_path: str = None,
+        expand: bool = False,
+        incremental: bool = False,
+    ):
         """Generate a policy of an agent from its qfunction.
 
         Args:
             kind (str): one of the strings `'random'`, `'greedy'` or `'softmax'`
                         which will be used to define the probability.
-            json_policy_path (str, optional): A path to save the policy as a json file.
+            json_policy_path (str, optional): A path to save the policy as a json file (or as a
+                                                binary table if it ends with `.qtab`).
                                                 Defaults to None. If it is none, then the policy
                                                 will only be returned as a dictionary.
+            expand (bool, optional): for a `symmetric` agent, flag saying wether the policy is
+                                    expanded from canonical states to all their rotations and
+                                    reflections. Defaults to False.
+            incremental (bool, optional): flag saying wether only the states updated since the
+                                    last incremental generation (with the same `kind` and `expand`)
+                                    are regenerated. The agent then keeps the policy and returns
+                                    it patched, and an existing binary table at `json_policy_path`
+                                    is patched in place (json files are rewritten). The first
+                                    incremental generation is a full one. Defaults to False.
 
         Returns:
             dict: generated policy
         """
-        policy = {}
-        for state, qvalue in self.qfunction.items():
-            policy[state] = return_probabilities(
-                state=state, qvalue_state=qvalue, kind=kind
-            )
+        key = (kind, expand)
+        if incremental and key in self._policies:
+            policy = self._policies[key]
+            changes = self._probabilities(list(self._dirty_states[key]), kind)
+            if self.symmetric and expand:
+                changes = expand_policy(changes)
+            policy.update(changes)
+        else:
+            policy = self._probabilities(list(self.qfunction), kind)
+            if self.symmetric and expand:
+                policy = expand_policy(policy)
+            changes = None
+            if incremental:
+                self._policies[key] = policy
+        if incremental:
+            self._dirty_states[key] = set()
+
         if json_policy_path is not None:
-            generate_json(policy, json_policy_path)
+            if not json_policy_path.endswith(".qtab"):
+                generate_json(policy, json_policy_path)
+            elif changes is not None and os.path.exists(json_policy_path):
+                patch_table(json_policy_path, changes)
+            else:
+                save_table(policy, json_policy_path)
         return policy
+
+
+class _Node:
+    """Node of the search tree of `MCTSPlayer`."""
+
+    __slots__ = (
+        "state",
+        "parent",
+        "action",
+        "mover",
+        "children",
+        "untried",
+        "visits",
+        "wins",
+    )
+
+    def __init__(self) -> None:
+        self.set(None, -1, -1, -1, ())
+
+    def set(self, state, parent: int, action: int, mover: int, untried: Sequence[int]):
+        self.state = state  # hashed state of the node
+        self.parent = parent  # index of the parent node (-1 for the root)
+        self.action = action  # action leading from the parent to the node
+        self.mover = mover  # index of the player who played `action`
+        self.children = []  # indexes of the expanded children
+        self.untried = list(untried)  # actions which are not expanded yet
+        self.visits = 0
+        self.wins = 0.0  # wins of `mover` (draws count as half a win)
+
+
+class MCTSPlayer(Player):
+    def __init__(
+        self,
+        environment,
+        time_budget: float = 100,
+        max_iterations: int = None,
+        max_nodes: int = 100000,
+        exploration: float = 1.4,
+        sampler: Sampler = None,
+    ) -> None:
+        """A Monte Carlo Tree Search player (UCT with random rollouts).
+
+        It needs no training and plays on any board: at each move, games are simulated from
+        the current state on clones of the environment until the budget is spent, and the most
+        visited action is played. The subtree of the state reached after the opponent's move is
+        kept for the next move.
+
+        Nodes live in an arena of at most `max_nodes` nodes which are reused from one move to
+        the next. When the arena is full, simulations still run but the tree stops growing.
+
+        Args:
+            environment (BitboardTicTacToe | KInARow): environment where the player plays. It is
+                            only read (through `clone`) and must be in the state given to `act`.
+            time_budget (float, optional): thinking time of each move in milliseconds.
+                            Defaults to 100. If None is given, only `max_iterations` bounds the search.
+            max_iterations (int, optional): maximum number of simulations of each move.
+                            Defaults to None (no maximum).
+            max_nodes (int, optional): maximum number of nodes of the tree. Defaults to 100000.
+            exploration (float, optional): exploration constant of UCT. Defaults to 1.4.
+            sampler (Sampler, optional): sampler of the random numbers of the rollouts.
+                            Defaults to None. If None is given, the global `np.random` generator is used.
+
+        Raises:
+            ValueError: raise Error if neither `time_budget` nor `max_iterations` is given
+        """
+        if time_budget is None and max_iterations is None:
+            raise ValueError("time_budget or max_iterations must be given")
+        self.environment = environment
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.max_nodes = max_nodes
+        self.exploration = exploration
+        self.sampler = sampler
+        self.last_iterations = 0  # number of simulations of the last move
+        self._nodes = []  # arena of nodes, the first `_size` ones are in the tree
+        self._size = 0
+        self._last = None  # index of the node of the last played action
+
+    def _randint(self, n: int):
+        """Uniform integer in `[0, n)` from the sampler, or from `np.random` if there is none."""
+        if self.sampler is None:
+            return np.random.randint(n)
+        return self.sampler.integers(n)
+
+    def reset(self):
+        """Forget the search tree (e.g. when the environment is replaced)."""
+        self._size = 0
+        self._last = None
+
+    def _new_node(self, state, parent: int, action: int, mover: int, untried):
+        """Take the next free node of the arena and return its index."""
+        if self._size == len(self._nodes):
+            self._nodes.append(_Node())
+        self._nodes[self._size].set(state, parent, action, mover, untried)
+        self._size += 1
+        return self._size - 1
+
+    def _keep_subtree(self, root: int):
+        """Move the subtree of a node to the front of the arena, the node becoming the root."""
+        nodes = self._nodes
+        order = [root]
+        for index in order:  # breadth first
+            order.extend(nodes[index].children)
+        new_index = {index: position for position, index in enumerate(order)}
+        for index in order:
+            node = nodes[index]
+            node.parent = new_index.get(node.parent, -1)
+            node.children = [new_index[child] for child in node.children]
+        kept = set(order)
+        self._nodes = [nodes[index] for index in order] + [
+            node for index, node in enumerate(nodes) if index not in kept
+        ]
+        self._size = len(order)
+
+    def _root(self, state, environment):
+        """Index of the root node of a search at the given state (always 0)."""
+        if self._last is not None:
+            for child in self._nodes[self._last].children:
+                if self._nodes[child].state == state:
+                    self._keep_subtree(child)
+                    return 0
+        self._size = 0
+        return self._new_node(
+            state, -1, -1, 1 - environment.whose_turn(), environment.legal_actions()
+        )
+
+    def _select(self, index: int):
+        """Child of a node with the highest upper confidence bound."""
+        nodes = self._nodes
+        log_visits = math.log(nodes[index].visits)
+        best, best_score = -1, -math.inf
+        for child in nodes[index].children:
+            node = nodes[child]
+            score = node.wins / node.visits + self.exploration * math.sqrt(
+                log_visits / node.visits
+            )
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def _simulate(self, root: int, root_environment):
+        """Run one selection, expansion, rollout and backpropagation from the root."""
+        nodes = self._nodes
+        environment = root_environment.clone()
+        index = root
+        path = [root]
+        while not nodes[index].untried and nodes[index].children:
+            index = self._select(index)
+            environment.play_action(nodes[index].action)
+            path.append(index)
+
+        node = nodes[index]
+        if node.untried and self._size < self.max_nodes:
+            action = node.untried.pop(self._randint(len(node.untried)))
+            mover = environment.whose_turn()
+            environment.play_action(action)
+            child = self._new_node(
+                environment.hashed_state,
+                index,
+                action,
+                mover,
+                environment.legal_actions(),
+            )
+            node.children.append(child)
+            path.append(child)
+
+        # random rollout: empty cells are drawn without replacement (lazy shuffle)
+        actions = list(environment.legal_actions())
+        remaining = len(actions)
+        while not environment.end:
+            draw = self._randint(remaining)
+            remaining -= 1
+            actions[draw], actions[remaining] = actions[remaining], actions[draw]
+            environment.play_action(actions[remaining])
+
+        winner = environment.winner
+        for index in path:
+            node = nodes[index]
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.mover:
+                node.wins += 1
+
+    def act(self, state: Union[str, int], *args, **kwargs):
+        """Search the best action at the current state of the environment.
+
+        At least one simulation is run, whatever the budget.
+
+        Args:
+            state (str | int): current state (hashed state of the environment)
+
+        Raises:
+            ValueError: raise Error if the environment is not in the given state or the game is over
+
+        Returns:
+            int: the most visited action
+        """
+        environment = self.environment.clone()
+        if environment.hashed_state != state or environment.end:
+            raise ValueError(f"the environment is not at a playable state {state}")
+        root = self._root(state, environment)
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.perf_counter() + self.time_budget / 1000
+        iterations = 0
+        while True:
+            self._simulate(root, environment)
+            iterations += 1
+            if self.max_iterations is not None and iterations >= self.max_iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        self.last_iterations = iterations
+
+        nodes = self._nodes
+        if not nodes[root].children:  # no room left in the arena
+            self._last = None
+            untried = nodes[root].untried
+            return untried[self._randint(len(untried))]
+        self._last = max(nodes[root].children, key=lambda child: nodes[child].visits)
+        return nodes[self._last].action
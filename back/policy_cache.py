@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import *
+
+from back.qtable import DenseQTable
+from back.sampler import CumulativePolicy
+from back.solver import perfect_policy
+from back.utils import read_json
+
+
+class PolicyCache:
+    def __init__(self, max_entries: int = 8) -> None:
+        """Process-wide cache of loaded policies and Q-functions with LRU eviction.
+
+        Entries are keyed by the path of the file, its modification time and the loader,
+        so a file which changes on disk is loaded again. Loads run on a background thread:
+        `preload` starts one without waiting and `get` waits for it (a file is never loaded
+        twice at the same time).
+
+        Loaded values are shared, so they should not be modified (copy them first).
+
+        Args:
+            max_entries (int, optional): maximum number of loaded values kept. Defaults to 8.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> future of the loaded value
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def _key(path: str, loader: Callable):
+        if path is None:
+            return None, None, loader
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns, loader
+
+    def preload(self, path: str, loader: Callable[[str], Any] = read_json):
+        """Start loading a file in the background if it is not in the cache yet.
+
+        Args:
+            path (str): path of the file. If None is given, `loader` is called without argument.
+            loader (Callable[[str], Any], optional): function loading the file. Defaults to `read_json`.
+
+        Returns:
+            Future: future of the loaded value
+        """
+        key = self._key(path, loader)
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+                return future
+            path, _, loader = key
+            for stale in [k for k in self._entries if k[0] == path and k[2] == loader]:
+                del self._entries[stale]  # older version of the same file
+            args = () if path is None else (path,)
+            future = self._executor.submit(loader, *args)
+            self._entries[key] = future
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.add_done_callback(lambda done: self._discard_failed(key, done))
+        return future
+
+    def get(self, path: str, loader: Callable[[str], Any] = read_json):
+        """Loaded value of a file, from the cache if possible.
+
+        Args:
+            path (str): path of the file. If None is given, `loader` is called without argument.
+            loader (Callable[[str], Any], optional): function loading the file. Defaults to `read_json`.
+
+        Returns:
+            Any: the loaded value
+        """
+        return self.preload(path, loader).result()
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def _discard_failed(self, key: tuple, future: Future):
+        """Remove a failed load so it can be retried."""
+        if future.exception() is not None:
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@lru_cache(maxsize=None)
+def get_policy_cache():
+    """Policy cache shared by the whole process.
+
+    Returns:
+        PolicyCache: the policy cache
+    """
+    return PolicyCache()
+
+
+def load_policy(json_path: str):
+    """Load a cpu policy ready for sampling."""
+    return CumulativePolicy(read_json(json_path))
+
+
+def load_qtable(json_path: str):
+    """Load a cpu Q-function as a dense Q-table."""
+    return DenseQTable.from_dict(read_json(json_path, return_as_array=True))
+
+
+def load_perfect_policy():
+    """Load the policy of the solver ready for sampling."""
+    return CumulativePolicy(perfect_policy())
+
+
+def cpu_level(name: str):
+    """Level (`'0'` to `'5'`) of a cpu player's name, None for other names."""
+    if "cpu" == name[:3].lower() and len(name) == 4 and name[-1] in "012345":
+        return name[-1]
+    return None
+
+
+def level_source(player_n: int, lvl: str):
+    """Path and loader of the policy (or Q-function) of a cpu level.
+
+    Args:
+        player_n (int): index (1 or 2) of player
+        lvl (str): level from `'0'` to `'4'`
+
+    Returns:
+        tuple[str, Callable]: path (None for the solver) and loader for `PolicyCache`
+    """
+    if lvl == "3":
+        return f"./src/qvalue/qvalue_player{player_n}.json", load_qtable
+    if lvl == "4":
+        return None, load_perfect_policy
+    level = {0: "easy", 1: "medium", 2: "hard"}[int(lvl)]
+    player = "" if level == "easy" else f"_player{player_n}"
+    return f"./src/policy/{level}{player}.json", load_policy
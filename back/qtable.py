@@ -0,0 +1,144 @@
+import numpy as np
+from collections.abc import MutableMapping
+from typing import *
+
+from back.utils import NUM_CELLS, NUM_STATES, code_to_state
+
+# weight of each cell in the state code, i.e. `code = cells @ STATE_CODE_WEIGHTS`
+STATE_CODE_WEIGHTS = 3 ** np.arange(NUM_CELLS - 1, -1, -1)
+
+
+def _state_digits():
+    """Digits (0 for empty, 1 for player 1 and 2 for player 2) of every state code.
+
+    Returns:
+        np.ndarray: `(3**9, 9)` array where row `code` holds the cells of the state
+    """
+    codes = np.arange(NUM_STATES)
+    return (codes[:, None] // STATE_CODE_WEIGHTS % 3).astype(np.int8)
+
+
+STATE_DIGITS = _state_digits()
+LEGAL_MASK = STATE_DIGITS == 0
+
+
+def _initial_values():
+    """Initial Q-values of every state, as given by `return_probabilities` with
+    a zero Q-value: uniform on empty cells, or action 0 for filled boards.
+
+    Returns:
+        np.ndarray: `(3**9, 9)` array of initial Q-values
+    """
+    num_legal = LEGAL_MASK.sum(axis=-1, keepdims=True)
+    values = np.where(LEGAL_MASK, 1 / np.maximum(num_legal, 1), 0.0)
+    values[num_legal[:, 0] == 0, 0] = 1
+    return values
+
+
+INITIAL_VALUES = _initial_values()
+
+
+class DenseQTable(MutableMapping):
+    def __init__(self, values: np.ndarray = None, visited: np.ndarray = None):
+        """A dense Q-table holding one row of Q-values for each of the `3**9` state codes.
+
+        It behaves like the dictionary `QAgent.qfunction`: keys are hashed states
+        (`str`) or state codes (`int`) and values are `1-D` arrays of Q-values
+        (views on the table, so they can be updated in place). Every state is
+        available from the start with the same initial value `QAgent` would give
+        on a miss; only the states which have been accessed are listed when
+        iterating over the table (unless the table is read-only, e.g. loaded
+        with `back.storage.load_table`).
+
+        Args:
+            values (np.ndarray, optional): `(3**9, 9)` array of Q-values. Defaults to None.
+                                If None is given, initial Q-values are used.
+            visited (np.ndarray, optional): `3**9` boolean array of the states to list.
+                                Defaults to None. If None is given, no states will be listed.
+        """
+        self.values = values if values is not None else INITIAL_VALUES.copy()
+        self.visited = (
+            visited if visited is not None else np.zeros(NUM_STATES, dtype=bool)
+        )
+
+    @staticmethod
+    def code(state: Union[str, int]):
+        """Integer code of a state.
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Returns:
+            int: code of the state
+        """
+        return int(state, 3) if isinstance(state, str) else state
+
+    @classmethod
+    def from_dict(cls, qfunction: Mapping):
+        """Generate a dense Q-table from a dictionary Q-function.
+
+        Args:
+            qfunction (Mapping): Q-value function of each state at each action
+
+        Returns:
+            DenseQTable: the dense Q-table
+        """
+        table = cls()
+        for state, qvalue in qfunction.items():
+            table[state] = qvalue
+        return table
+
+    def to_dict(self):
+        """Generate a dictionary Q-function from the listed states.
+
+        Returns:
+            dict: a dictionary with states as keys and Q-values (`np.ndarray`) as values
+        """
+        return {state: qvalue.copy() for state, qvalue in self.items()}
+
+    def copy(self):
+        """Copy of the table.
+
+        Returns:
+            DenseQTable: a copy of the table
+        """
+        return DenseQTable(self.values.copy(), self.visited.copy())
+
+    def legal_mask(self, state: Union[str, int]):
+        """Mask of allowed actions at a given state.
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Returns:
+            np.ndarray: boolean array which is `True` on empty cells
+        """
+        return LEGAL_MASK[self.code(state)]
+
+    def __contains__(self, state):
+        try:
+            return 0 <= self.code(state) < NUM_STATES
+        except (TypeError, ValueError):
+            return False
+
+    def __getitem__(self, state):
+        code = self.code(state)
+        if not self.visited[code] and self.visited.flags.writeable:
+            self.visited[code] = True
+        return self.values[code]
+
+    def __setitem__(self, state, qvalue):
+        code = self.code(state)
+        self.values[code] = qvalue
+        self.visited[code] = True
+
+    def __delitem__(self, state):
+        code = self.code(state)
+        self.values[code] = INITIAL_VALUES[code]
+        self.visited[code] = False
+
+    def __iter__(self):
+        return (code_to_state(int(code)) for code in np.flatnonzero(self.visited))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.visited))
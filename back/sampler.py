@@ -0,0 +1,208 @@
+import bisect
+import itertools
+import numpy as np
+from collections.abc import Mapping
+from typing import *
+
+
+def cumulative(proba: Sequence[float]):
+    """Cumulative sums of a probability distribution.
+
+    Args:
+        proba (Sequence[float]): probability of each action
+
+    Returns:
+        list: cumulative sums of the probabilities
+    """
+    return list(itertools.accumulate(proba))
+
+
+class Sampler:
+    def __init__(
+        self, seed: Union[int, np.random.SeedSequence] = None, block_size: int = 4096
+    ) -> None:
+        """Random sampler drawing blocks of uniform numbers from a `numpy.random.Generator`
+        and serving them one by one, which avoids the overhead of a numpy call per sample.
+
+        All samples are derived from the uniform numbers, so results are reproducible
+        from the seed.
+
+        Args:
+            seed (int | np.random.SeedSequence, optional): seed of the generator. Defaults to None.
+            block_size (int, optional): number of uniform numbers drawn at once. Defaults to 4096.
+        """
+        self._seed_sequence = (
+            seed
+            if isinstance(seed, np.random.SeedSequence)
+            else np.random.SeedSequence(seed)
+        )
+        self._generator = np.random.default_rng(self._seed_sequence)
+        self.block_size = block_size
+        self._buffer = []
+        self._position = 0
+
+    def spawn(self, n: int):
+        """Generate independent samplers derived from the seed of this one.
+
+        Args:
+            n (int): number of samplers
+
+        Returns:
+            list[Sampler]: the new samplers
+        """
+        return [
+            Sampler(child, self.block_size) for child in self._seed_sequence.spawn(n)
+        ]
+
+    def uniform(self):
+        """Sample a number uniformly in `[0, 1)`.
+
+        Returns:
+            float: the sample
+        """
+        if self._position == len(self._buffer):
+            self._buffer = self._generator.random(self.block_size).tolist()
+            self._position = 0
+        sample = self._buffer[self._position]
+        self._position += 1
+        return sample
+
+    def random(self, size: Union[int, tuple]):
+        """Sample an array of numbers uniformly in `[0, 1)` at once, directly from the
+        generator (for vectorized sampling).
+
+        Args:
+            size (int | tuple): shape of the array
+
+        Returns:
+            np.ndarray: the samples
+        """
+        return self._generator.random(size)
+
+    def integers(self, n: int):
+        """Sample an integer uniformly in `[0, n)`.
+
+        Args:
+            n (int): number of possible values
+
+        Returns:
+            int: the sample
+        """
+        return int(self.uniform() * n)
+
+    def categorical(self, cdf: Sequence[float]):
+        """Sample an index from a distribution given by its cumulative sums.
+
+        Args:
+            cdf (Sequence[float]): cumulative sums of the probability of each index
+                                    (see `cumulative`)
+
+        Returns:
+            int: the sample
+        """
+        index = bisect.bisect_right(cdf, self.uniform() * cdf[-1])
+        return min(index, len(cdf) - 1)
+
+    def get_state(self):
+        """State of the sampler, to restore it with `set_state`.
+
+        Returns:
+            dict: the state of the sampler
+        """
+        return {
+            "bit_generator": self._generator.bit_generator.state,
+            "buffer": list(self._buffer),
+            "position": self._position,
+        }
+
+    def set_state(self, state: dict):
+        """Restore a state given by `get_state`.
+
+        Args:
+            state (dict): the state of the sampler
+        """
+        self._generator.bit_generator.state = state["bit_generator"]
+        self._buffer = list(state["buffer"])
+        self._position = state["position"]
+
+
+class CumulativePolicy(Mapping):
+    def __init__(self, policy: Mapping):
+        """Policy keeping the cumulative sums of its distributions, computed once per state,
+        for sampling with `Sampler.categorical`.
+
+        It behaves like the wrapped policy.
+
+        Args:
+            policy (Mapping): a policy with states as keys and distributions as values
+        """
+        self.policy = policy
+        self._cdfs = {}
+
+    def cdf(self, state: str):
+        """Cumulative sums of the distribution at a state of the policy.
+
+        Args:
+            state (str): state of the policy
+
+        Returns:
+            list: cumulative sums of the probabilities
+        """
+        cdf = self._cdfs.get(state)
+        if cdf is None:
+            cdf = self._cdfs[state] = cumulative(self.policy[state])
+        return cdf
+
+    def __contains__(self, state):
+        return state in self.policy
+
+    def __getitem__(self, state):
+        return self.policy[state]
+
+    def __iter__(self):
+        return iter(self.policy)
+
+    def __len__(self):
+        return len(self.policy)
+
+
+def cdf_table(probabilities: np.ndarray, legal_mask: np.ndarray = None):
+    """Cumulative sums of a dense table of distributions (one row per state code), for
+    sampling many states at once with `sample_cdf_table`.
+
+    Rows are normalized and, if a mask is given, restricted to the allowed actions (rows
+    without allowed probability are uniform on allowed actions). The last cumulative sum
+    of each row is exactly 1, so a sample never falls after the last possible action.
+
+    Args:
+        probabilities (np.ndarray): `(S, A)` array of distributions
+        legal_mask (np.ndarray, optional): `(S, A)` boolean array of allowed actions.
+                                            Defaults to None.
+
+    Returns:
+        np.ndarray: `(S, A)` array of cumulative sums
+    """
+    weights = np.clip(np.asarray(probabilities, dtype=float), 0, None)
+    if legal_mask is not None:
+        weights = np.where(legal_mask, weights, 0.0)
+        empty = weights.sum(axis=-1) == 0
+        weights[empty] = legal_mask[empty]
+    cdf = np.cumsum(weights, axis=-1)
+    total = cdf[:, -1:]
+    cdf = np.divide(cdf, total, out=np.ones_like(cdf), where=total > 0)
+    cdf[cdf >= 1 - 1e-12] = 1.0
+    return cdf
+
+
+def sample_cdf_table(cdf: np.ndarray, rows: np.ndarray, uniforms: np.ndarray):
+    """Sample one action for each given row of a table built by `cdf_table`.
+
+    Args:
+        cdf (np.ndarray): `(S, A)` array of cumulative sums
+        rows (np.ndarray): rows (state codes) to sample
+        uniforms (np.ndarray): one uniform number in `[0, 1)` for each row
+
+    Returns:
+        np.ndarray: sampled actions
+    """
+    return (cdf[rows] <= uniforms[:, None]).sum(axis=-1)
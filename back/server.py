@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+import numpy as np
+from typing import *
+
+from back.tictactoe import BitboardTicTacToe
+from back.player_module import QAgent
+from back.policy_cache import get_policy_cache, cpu_level, level_source
+from back.sampler import Sampler
+from back.state_graph import get_state_graph
+
+# cpu levels served (the search level `cpu5` is too slow to share a core between sessions)
+LEVELS = ("cpu0", "cpu1", "cpu2", "cpu3", "cpu4")
+
+
+class LatencyStats:
+    def __init__(self, window: int = 10000) -> None:
+        """Latency of the requests of each operation.
+
+        Counts and means cover every request, percentiles the last `window` requests.
+
+        Args:
+            window (int, optional): number of latencies kept for percentiles. Defaults to 10000.
+        """
+        self.window = window
+        self._counts = {}
+        self._totals = {}
+        self._maxima = {}
+        self._latencies = {}
+
+    def record(self, op: str, seconds: float):
+        """Record the latency of a request.
+
+        Args:
+            op (str): operation of the request
+            seconds (float): latency in seconds
+        """
+        if op not in self._counts:
+            self._counts[op], self._totals[op], self._maxima[op] = 0, 0.0, 0.0
+            self._latencies[op] = deque(maxlen=self.window)
+        self._counts[op] += 1
+        self._totals[op] += seconds
+        self._maxima[op] = max(self._maxima[op], seconds)
+        self._latencies[op].append(seconds)
+
+    def summary(self):
+        """Latency statistics in milliseconds.
+
+        Returns:
+            dict: for each operation: `count`, `mean_ms`, `p50_ms`, `p95_ms`, `p99_ms` and `max_ms`
+        """
+        summary = {}
+        for op, count in self._counts.items():
+            p50, p95, p99 = 1000 * np.percentile(self._latencies[op], (50, 95, 99))
+            summary[op] = {
+                "count": count,
+                "mean_ms": 1000 * self._totals[op] / count,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": 1000 * self._maxima[op],
+            }
+        return summary
+
+
+class GameServer:
+    def __init__(self, seed: int = None, max_sessions: int = 100000) -> None:
+        """Headless server of Tic Tac Toe games against the cpu levels `cpu0` to `cpu4`.
+
+        Clients send one json object per line and receive one json object per line. Each
+        request has an `op` field and an optional `id` field which is sent back in the response:
+
+        - `{"op": "new", "levels": [null, "cpu2"]}` starts a game (null for a player of the
+          client, a cpu level otherwise) and plays the cpu moves until the client's turn
+        - `{"op": "play", "session": 1, "action": 4}` plays a move of the client, then the cpu moves
+        - `{"op": "move", "level": "cpu4", "state": "100000000"}` asks the move of a cpu level
+          at a state, outside of any session
+        - `{"op": "close", "session": 1}` ends a game
+        - `{"op": "stats"}` gives the latency statistics of the requests
+
+        Responses hold `latency_ms` (time spent by the server on the request) and either the
+        result or an `error` message. Each policy is loaded once (through the process-wide
+        `PolicyCache`) and shared by every session. Sessions live in memory and are removed when
+        the connection which created them is closed.
+
+        Args:
+            seed (int, optional): seed of the cpu moves. Defaults to None.
+            max_sessions (int, optional): maximum number of open games. Defaults to 100000.
+        """
+        self.sampler = Sampler(seed)
+        self.max_sessions = max_sessions
+        self.sessions = {}  # session id -> game and levels
+        self.latency = LatencyStats()
+        self._session_ids = itertools.count(1)
+        self._agents = {}  # (level, player_n) -> shared policy or Q-agent
+
+    def preload(self):
+        """Start loading the policies of every level in the background."""
+        for level, player_n in itertools.product(LEVELS, (1, 2)):
+            get_policy_cache().preload(*level_source(player_n, cpu_level(level)))
+
+    def agent(self, level: str, player_n: int):
+        """Shared policy (or Q-agent) of a cpu level.
+
+        Args:
+            level (str): cpu level from `'cpu0'` to `'cpu4'`
+            player_n (int): index (1 or 2) of the player
+
+        Raises:
+            ValueError: raise Error if the level is unknown
+
+        Returns:
+            CumulativePolicy | QAgent: the policy or Q-agent of the level
+        """
+        key = (level, player_n)
+        if key not in self._agents:
+            if level not in LEVELS:
+                raise ValueError(f"unknown level {level!r}, expected one of {LEVELS}")
+            lvl = cpu_level(level)
+            loaded = get_policy_cache().get(*level_source(player_n, lvl))
+            if lvl == "3":  # greedy and never updated, so the table can be shared
+                loaded = QAgent(
+                    9, 0.999, 0.9, 0, qfunction=loaded, dense=True, sampler=self.sampler
+                )
+            self._agents[key] = loaded
+        return self._agents[key]
+
+    def choose_action(self, level: str, player_n: int, state: str):
+        """Move of a cpu level at a state.
+
+        Args:
+            level (str): cpu level from `'cpu0'` to `'cpu4'`
+            player_n (int): index (1 or 2) of the player to move
+            state (str): hashed state of a non terminal state
+
+        Returns:
+            int: the action of the cpu level
+        """
+        agent = self.agent(level, player_n)
+        if isinstance(agent, QAgent):
+            return agent.act(state, eval=True)
+        if state in agent:
+            return self.sampler.categorical(agent.cdf(state))
+        return get_state_graph().sample_action(state, self.sampler)
+
+    def _play_cpu(self, session: dict):
+        """Play the cpu moves until the client's turn or the end of the game."""
+        game = session["game"]
+        actions = []
+        while not game.end and session["levels"][game.whose_turn()] is not None:
+            hand = game.whose_turn()
+            action = self.choose_action(
+                session["levels"][hand], hand + 1, game.hashed_state
+            )
+            game.step(action)
+            actions.append(action)
+        return actions
+
+    def _status(self, session_id: int):
+        session = self.sessions[session_id]
+        game = session["game"]
+        return {
+            "session": session_id,
+            "state": game.hashed_state,
+            "turn": game.whose_turn() + 1,
+            "done": game.end,
+            "winner": None if game.winner is None else game.winner + 1,
+            "legal_actions": list(game.legal_actions()),
+        }
+
+    def _session(self, request: dict, owned: set):
+        session_id = request.get("session")
+        if session_id not in owned:
+            raise ValueError(f"unknown session {session_id!r}")
+        return session_id, self.sessions[session_id]
+
+    def handle(self, request: dict, owned: set):
+        """Answer a request.
+
+        Args:
+            request (dict): the request (see `GameServer`)
+            owned (set): ids of the sessions of the connection, updated in place
+
+        Raises:
+            ValueError: raise Error if the request is not valid
+
+        Returns:
+            dict: the response, without `id` and `latency_ms`
+        """
+        op = request.get("op")
+        if op == "new":
+            levels = list(request.get("levels", [None, None]))
+            if len(levels) != 2:
+                raise ValueError("levels must hold a level (or null) for both players")
+            for player_n, level in enumerate(levels, 1):
+                if level is not None:
+                    self.agent(level, player_n)
+            if len(self.sessions) >= self.max_sessions:
+                raise ValueError("too many open sessions")
+            session_id = next(self._session_ids)
+            self.sessions[session_id] = {
+                "game": BitboardTicTacToe(),
+                "levels": levels,
+            }
+            owned.add(session_id)
+            cpu_actions = self._play_cpu(self.sessions[session_id])
+            return {**self._status(session_id), "cpu_actions": cpu_actions}
+
+        if op == "play":
+            session_id, session = self._session(request, owned)
+            game = session["game"]
+            action = request.get("action")
+            if session["levels"][game.whose_turn()] is not None:
+                raise ValueError("it is not the turn of the client")
+            if type(action) is not int or action not in game.legal_actions():
+                raise ValueError(f"action {action!r} is not allowed")
+            game.step(action)
+            cpu_actions = self._play_cpu(session)
+            return {**self._status(session_id), "cpu_actions": cpu_actions}
+
+        if op == "move":
+            state = request.get("state")
+            graph = get_state_graph()
+            if not isinstance(state, str) or len(state) != 9 or set(state) - set("012"):
+                raise ValueError(f"invalid state {state!r}")
+            if graph.index_of[int(state, 3)] < 0:
+                raise ValueError(f"state {state} is not reachable")
+            if not graph.legal_actions(state):
+                raise ValueError(f"state {state} is terminal")
+            player_n = 1 if state.count("1") == state.count("2") else 2
+            level = request.get("level")
+            return {"action": int(self.choose_action(level, player_n, state))}
+
+        if op == "close":
+            session_id, _ = self._session(request, owned)
+            del self.sessions[session_id]
+            owned.discard(session_id)
+            return {"session": session_id, "closed": True}
+
+        if op == "stats":
+            return {"sessions": len(self.sessions), "latency": self.latency.summary()}
+
+        raise ValueError(f"unknown op {op!r}")
+
+    def respond(self, line: bytes, owned: set):
+        """Answer a request line and record its latency.
+
+        Args:
+            line (bytes): json line of the request
+            owned (set): ids of the sessions of the connection, updated in place
+
+        Returns:
+            dict: the response
+        """
+        start = time.perf_counter()
+        request, op = {}, "invalid"
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a json object")
+            op = str(request.get("op"))
+            response = self.handle(request, owned)
+        except (ValueError, TypeError, OSError) as error:
+            response = {"error": str(error)}
+        if "id" in request:
+            response["id"] = request["id"]
+        elapsed = time.perf_counter() - start
+        self.latency.record(op, elapsed)
+        response["latency_ms"] = 1000 * elapsed
+        return response
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Answer the requests of a connection until it is closed."""
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = self.respond(line, owned)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        """Serve clients until the task is cancelled.
+
+        Args:
+            host (str, optional): address to listen on. Defaults to `'127.0.0.1'`.
+            port (int, optional): port to listen on. Defaults to 8765.
+        """
+        self.preload()
+        server = await asyncio.start_server(self.serve_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless server of Tic Tac Toe games against the cpu levels (json lines over TCP)."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-sessions", type=int, default=100000)
+    args = parser.parse_args()
+
+    server = GameServer(args.seed, args.max_sessions)
+    print(f"Serving on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(json.dumps(server.latency.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
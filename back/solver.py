@@ -0,0 +1,278 @@
+import argparse
+import numpy as np
+from functools import lru_cache
+from typing import *
+
+from back.tictactoe import WIN_MASKS, CELL_CODE_INCREMENTS
+from back.utils import (
+    NUM_CELLS,
+    code_to_state,
+    generate_json,
+    read_json,
+    return_probabilities_batch,
+    states_to_matrix,
+)
+
+FULL_BOARD = (1 << NUM_CELLS) - 1
+MOVE_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)  # center, corners then edges
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+
+def _is_win(marks: int):
+    """Check wether the given marks of a player contain a full line."""
+    return any(marks & mask == mask for mask in WIN_MASKS)
+
+
+class Solver:
+    def __init__(self) -> None:
+        """Exact Tic Tac Toe solver using negamax with alpha-beta pruning and a
+        transposition table keyed by the state code.
+
+        Values are given from the point of view of the player who has to move:
+        a win is worth `1 +` the number of empty cells left after the winning move
+        (so that faster wins are preferred), a draw is worth 0 and a loss is worth
+        the opposite of the win of the opponent.
+        """
+        self.table = {}
+
+    @staticmethod
+    def decode(state: str):
+        """Bitboards, code and index of the player to move of a hashed state.
+
+        Args:
+            state (str): hashed state
+
+        Returns:
+            tuple[tuple[int, int], int, int]: marks of both players, state code and
+                                            index of the player to move
+        """
+        marks = [0, 0]
+        for cell, char in enumerate(state):
+            if char != "0":
+                marks[int(char) - 1] |= 1 << cell
+        hand = 0 if bin(marks[0]).count("1") == bin(marks[1]).count("1") else 1
+        return tuple(marks), int(state, 3), hand
+
+    def _move_score(
+        self,
+        marks: Tuple[int, int],
+        code: int,
+        hand: int,
+        cell: int,
+        alpha: float,
+        beta: float,
+    ):
+        """Value of playing at `cell` for the player to move, searched in the window `(alpha, beta)`."""
+        own = marks[hand] | 1 << cell
+        num_empty = NUM_CELLS - bin(marks[0] | marks[1]).count("1") - 1
+        if _is_win(own):
+            return num_empty + 1
+        if num_empty == 0:
+            return 0
+        child_marks = (own, marks[1]) if hand == 0 else (marks[0], own)
+        child_code = code + CELL_CODE_INCREMENTS[hand][cell]
+        return -self.negamax(child_marks, child_code, 1 - hand, -beta, -alpha)
+
+    def negamax(
+        self,
+        marks: Tuple[int, int],
+        code: int,
+        hand: int,
+        alpha: float = -np.inf,
+        beta: float = np.inf,
+    ):
+        """Value of a non terminal state for the player to move.
+
+        Args:
+            marks (tuple[int, int]): bitboards of both players
+            code (int): state code
+            hand (int): index of the player to move
+            alpha (float, optional): lower bound of the search window. Defaults to -inf.
+            beta (float, optional): upper bound of the search window. Defaults to inf.
+
+        Returns:
+            int: exact value if it is inside the window, otherwise a bound of it
+        """
+        alpha_orig = alpha
+        entry = self.table.get(code)
+        if entry is not None:
+            value, flag = entry
+            if flag == EXACT:
+                return value
+            if flag == LOWER_BOUND:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        empty = ~(marks[0] | marks[1]) & FULL_BOARD
+        best = -np.inf
+        for cell in MOVE_ORDER:
+            if not empty >> cell & 1:
+                continue
+            best = max(best, self._move_score(marks, code, hand, cell, alpha, beta))
+            alpha = max(alpha, best)
+            if alpha >= beta:
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table[code] = (best, flag)
+        return best
+
+    def move_values(self, state: str):
+        """Exact value of each allowed action at a non terminal state.
+
+        Args:
+            state (str): hashed state
+
+        Returns:
+            np.ndarray: `1-D` array of values of each action (0 for filled cells)
+        """
+        marks, code, hand = self.decode(state)
+        empty = ~(marks[0] | marks[1]) & FULL_BOARD
+        values = np.zeros(NUM_CELLS)
+        for cell in range(NUM_CELLS):
+            if empty >> cell & 1:
+                values[cell] = self._move_score(
+                    marks, code, hand, cell, -np.inf, np.inf
+                )
+        return values
+
+    def solve(self):
+        """Compute the values of the actions of every reachable non terminal state.
+
+        Returns:
+            dict: a dictionary with states (`str`) as keys and values of actions (`np.ndarray`) as values
+        """
+        solution = {}
+        stack = [((0, 0), 0, 0)]
+        while stack:
+            marks, code, hand = stack.pop()
+            state = code_to_state(code)
+            if state in solution:
+                continue
+            solution[state] = self.move_values(state)
+            empty = ~(marks[0] | marks[1]) & FULL_BOARD
+            for cell in range(NUM_CELLS):
+                if not empty >> cell & 1:
+                    continue
+                own = marks[hand] | 1 << cell
+                if _is_win(own) or (empty & ~(1 << cell)) == 0:
+                    continue  # terminal state
+                child_marks = (own, marks[1]) if hand == 0 else (marks[0], own)
+                stack.append(
+                    (child_marks, code + CELL_CODE_INCREMENTS[hand][cell], 1 - hand)
+                )
+        return solution
+
+
+@lru_cache(maxsize=None)
+def solved_values():
+    """Values of the actions of every reachable non terminal state, computed once.
+
+    Returns:
+        dict: a dictionary with states (`str`) as keys and values of actions (`np.ndarray`) as values
+    """
+    return Solver().solve()
+
+
+def perfect_policy(json_policy_path: str = None):
+    """Generate the policy of a perfect player, which chooses uniformly among optimal actions.
+
+    Args:
+        json_policy_path (str, optional): A path to save the policy as a json file.
+                                            Defaults to None. If it is none, then the policy
+                                            will only be returned as a dictionary.
+
+    Returns:
+        dict: the perfect policy, in the same format as `QAgent.generate_policy`
+    """
+    solution = solved_values()
+    states = list(solution)
+    probs = return_probabilities_batch(
+        states_to_matrix(states), np.array(list(solution.values())), "greedy"
+    )
+    policy = dict(zip(states, probs.tolist()))
+    if json_policy_path is not None:
+        generate_json(policy, json_policy_path)
+    return policy
+
+
+def evaluate_against_oracle(qfunction: Mapping, player_number: int = None):
+    """Measure how far the greedy actions of a Q-function are from optimal play.
+
+    Only the reachable non terminal states of the Q-function are evaluated.
+
+    Args:
+        qfunction (Mapping): Q-value function of each state at each action
+        player_number (int, optional): either 1 or 2. If it is given, only the states where
+                                        this player has to move are evaluated. Defaults to None.
+
+    Returns:
+        dict: - `states`: number of evaluated states
+              - `optimal_rate`: fraction of states where every greedy action is optimal
+              - `blunder_rate`: fraction of states where a greedy action changes the
+                                outcome (win, draw or loss) of the game
+              - `mean_regret`: average value lost by playing a greedy action
+    """
+    solution = solved_values()
+    num_states = num_optimal = num_blunders = 0
+    regret = 0.0
+    for state, qvalue in qfunction.items():
+        if state not in solution:
+            continue
+        if player_number is not None and Solver.decode(state)[2] != player_number - 1:
+            continue
+        values = solution[state]
+        legal = np.array([char == "0" for char in state])
+        qvalue = np.asarray(qvalue)
+        greedy = legal & (qvalue == qvalue[legal].max())
+        best = values[legal].max()
+        num_states += 1
+        num_optimal += np.all(values[greedy] == best)
+        num_blunders += np.any(np.sign(values[greedy]) != np.sign(best))
+        regret += best - values[greedy].mean()
+    return {
+        "states": num_states,
+        "optimal_rate": float(num_optimal / max(num_states, 1)),
+        "blunder_rate": float(num_blunders / max(num_states, 1)),
+        "mean_regret": float(regret / max(num_states, 1)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Solve Tic Tac Toe, export the perfect policy or evaluate Q-functions."
+    )
+    parser.add_argument(
+        "--export", metavar="JSON", help="path where to save the perfect policy"
+    )
+    parser.add_argument(
+        "--evaluate",
+        metavar="JSON",
+        nargs="+",
+        default=[],
+        help="Q-function json files to compare with optimal play",
+    )
+    parser.add_argument(
+        "--player",
+        type=int,
+        choices=(1, 2),
+        help="only evaluate the states where this player has to move",
+    )
+    args = parser.parse_args()
+    if args.export:
+        perfect_policy(args.export)
+    for json_path in args.evaluate:
+        qfunction = read_json(json_path, return_as_array=True)
+        print(json_path, evaluate_against_oracle(qfunction, args.player))
+
+
+if __name__ == "__main__":
+    main()
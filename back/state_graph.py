@@ -0,0 +1,172 @@
+import numpy as np
+from functools import lru_cache
+from typing import *
+
+from back.tictactoe import WIN_MASKS, CELL_CODE_INCREMENTS
+from back.utils import NUM_CELLS, NUM_STATES
+
+FULL_BOARD = (1 << NUM_CELLS) - 1
+
+
+class StateGraph:
+    def __init__(self) -> None:
+        """Graph of the 5478 positions reachable from the empty board.
+
+        States are sorted by code and described by compact arrays:
+        - `codes`: code of each state
+        - `legal_moves`: 9-bit mask of allowed actions (0 for terminal states)
+        - `successors`: code of the state reached by each action (-1 if not allowed)
+        - `terminal`: flag saying wether the game is over
+        - `winner`: index (1 or 2) of the winner, 0 if there is none
+
+        `index_of` maps every state code to its row (-1 for unreachable codes).
+        """
+        found = {0: (0, 0)}  # code -> bitboards of both players
+        frontier = [0]
+        while frontier:
+            next_frontier = []
+            for code in frontier:
+                marks = found[code]
+                if self._winner(marks) or marks[0] | marks[1] == FULL_BOARD:
+                    continue
+                hand = 0 if bin(marks[0]).count("1") == bin(marks[1]).count("1") else 1
+                for cell in range(NUM_CELLS):
+                    bit = 1 << cell
+                    if (marks[0] | marks[1]) & bit:
+                        continue
+                    child = code + CELL_CODE_INCREMENTS[hand][cell]
+                    if child not in found:
+                        found[child] = (
+                            (marks[0] | bit, marks[1])
+                            if hand == 0
+                            else (marks[0], marks[1] | bit)
+                        )
+                        next_frontier.append(child)
+            frontier = next_frontier
+
+        self.codes = np.array(sorted(found), dtype=np.uint16)
+        num_states = len(self.codes)
+        self.index_of = np.full(NUM_STATES, -1, dtype=np.int16)
+        self.index_of[self.codes] = np.arange(num_states)
+        self.legal_moves = np.zeros(num_states, dtype=np.uint16)
+        self.successors = np.full((num_states, NUM_CELLS), -1, dtype=np.int32)
+        self.terminal = np.zeros(num_states, dtype=bool)
+        self.winner = np.zeros(num_states, dtype=np.int8)
+        for index, code in enumerate(self.codes.tolist()):
+            marks = found[code]
+            self.winner[index] = self._winner(marks)
+            filled = marks[0] | marks[1]
+            self.terminal[index] = self.winner[index] > 0 or filled == FULL_BOARD
+            if self.terminal[index]:
+                continue
+            hand = 0 if bin(marks[0]).count("1") == bin(marks[1]).count("1") else 1
+            self.legal_moves[index] = ~filled & FULL_BOARD
+            for cell in range(NUM_CELLS):
+                if not filled >> cell & 1:
+                    self.successors[index, cell] = (
+                        code + CELL_CODE_INCREMENTS[hand][cell]
+                    )
+        self._legal_actions = tuple(
+            tuple(cell for cell in range(NUM_CELLS) if moves >> cell & 1)
+            for moves in self.legal_moves.tolist()
+        )
+
+    @staticmethod
+    def _winner(marks: Tuple[int, int]):
+        """Index (1 or 2) of the player who has a full line, 0 if there is none."""
+        for player, player_marks in enumerate(marks):
+            if any(player_marks & mask == mask for mask in WIN_MASKS):
+                return player + 1
+        return 0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def index(self, state: Union[str, int]):
+        """Row of a reachable state in the arrays of the graph.
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Raises:
+            KeyError: raise Error if the state is not reachable
+
+        Returns:
+            int: row of the state
+        """
+        code = int(state, 3) if isinstance(state, str) else state
+        index = int(self.index_of[code])
+        if index < 0:
+            raise KeyError(state)
+        return index
+
+    def legal_actions(self, state: Union[str, int]):
+        """Allowed actions at a state (none for terminal states).
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Returns:
+            tuple[int]: allowed actions
+        """
+        return self._legal_actions[self.index(state)]
+
+    def legal_mask(self, state: Union[str, int]):
+        """Mask of allowed actions at a state.
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Returns:
+            np.ndarray: boolean array which is `True` for allowed actions
+        """
+        return self.successors[self.index(state)] >= 0
+
+    def sample_action(self, state: Union[str, int], sampler=None):
+        """Sample an action uniformly among the allowed actions at a non terminal state.
+
+        Args:
+            state (str | int): hashed state or its code
+            sampler (Sampler, optional): sampler of the action. Defaults to None.
+                                        If None is given, `np.random` is used.
+
+        Returns:
+            int: a sample action
+        """
+        actions = self.legal_actions(state)
+        if sampler is not None:
+            return actions[sampler.integers(len(actions))]
+        return actions[np.random.randint(len(actions))]
+
+    def next_state(self, state: Union[str, int], action: int):
+        """Code of the state reached by playing an allowed action at a state.
+
+        Args:
+            state (str | int): hashed state or its code
+            action (int): allowed action
+
+        Returns:
+            int: code of the next state
+        """
+        return int(self.successors[self.index(state), action])
+
+    def is_terminal(self, state: Union[str, int]):
+        """Check wether the game is over at a state.
+
+        Args:
+            state (str | int): hashed state or its code
+
+        Returns:
+            bool: flag saying wether the state is terminal
+        """
+        return bool(self.terminal[self.index(state)])
+
+
+@lru_cache(maxsize=None)
+def get_state_graph():
+    """Graph of the reachable states, built once per process.
+
+    Returns:
+        StateGraph: the state graph
+    """
+    return StateGraph()
@@ -0,0 +1,228 @@
+import argparse
+import os
+import struct
+import numpy as np
+from collections.abc import Mapping
+from typing import *
+
+from back.qtable import DenseQTable
+from back.utils import NUM_CELLS, NUM_STATES, code_to_state, read_json
+
+# header: magic, version, layout, number of rows, number of actions (padded to 32 bytes)
+HEADER = struct.Struct("<4sHHII16x")
+MAGIC = b"TTTQ"
+VERSION = 1
+DENSE, SPARSE = 0, 1
+LAYOUTS = {"dense": DENSE, "sparse": SPARSE}
+VALUE_DTYPE = np.dtype("<f4")
+CODE_DTYPE = np.dtype("<u2")
+
+
+def _padded(size: int, alignment: int = 8):
+    """Smallest multiple of `alignment` greater or equal to `size`."""
+    return -(-size // alignment) * alignment
+
+
+class SparseTable(Mapping):
+    def __init__(self, codes: np.ndarray, values: np.ndarray):
+        """Read-only table of Q-values or probabilities stored as a sorted index of
+        state codes and one row of values for each of them.
+
+        Keys are hashed states (`str`) or state codes (`int`), values are `1-D` arrays.
+
+        Args:
+            codes (np.ndarray): sorted state codes
+            values (np.ndarray): `len(codes) x 9` array of values
+        """
+        self.codes = codes
+        self.values = values
+
+    def _index(self, state: Union[str, int]):
+        """Row of a state in `values`, or None if the state is not in the table."""
+        code = DenseQTable.code(state)
+        index = int(np.searchsorted(self.codes, code))
+        if index < len(self.codes) and self.codes[index] == code:
+            return index
+        return None
+
+    def __contains__(self, state):
+        try:
+            return self._index(state) is not None
+        except (TypeError, ValueError):
+            return False
+
+    def __getitem__(self, state):
+        index = self._index(state)
+        if index is None:
+            raise KeyError(state)
+        return self.values[index]
+
+    def __iter__(self):
+        return (code_to_state(int(code)) for code in self.codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def save_table(data: Mapping, path: str, layout: str = "dense"):
+    """Save a Q-function or a policy in the binary format.
+
+    The file starts with a 32 bytes header, followed by:
+    - `dense` layout: a `(3**9, 9)` float32 block of values indexed by state codes, then
+      one byte per state code saying wether the state is listed in the table;
+    - `sparse` layout: the sorted uint16 codes of the states, then their float32 values.
+
+    Args:
+        data (Mapping): a policy/qfunction of an agent (dictionary or `DenseQTable`)
+        path (str): path where the binary file will be stored
+        layout (str, optional): either `'dense'` or `'sparse'`. Defaults to `'dense'`.
+
+    Raises:
+        NotImplementedError: raise Error if layout is not one of `'dense'` and `'sparse'`
+    """
+    if layout not in LAYOUTS:
+        raise NotImplementedError
+    if layout == "dense":
+        table = data if isinstance(data, DenseQTable) else DenseQTable.from_dict(data)
+        num_rows = NUM_STATES
+        blocks = (
+            table.values.astype(VALUE_DTYPE),
+            table.visited.astype(np.uint8),
+        )
+    else:
+        if isinstance(data, DenseQTable):
+            codes = np.flatnonzero(data.visited)
+            values = data.values[codes]
+        else:
+            items = sorted(
+                (DenseQTable.code(state), value) for state, value in data.items()
+            )
+            codes = np.array([code for code, _ in items], dtype=int)
+            values = np.array([value for _, value in items], dtype=float)
+        num_rows = len(codes)
+        blocks = (codes.astype(CODE_DTYPE), values.astype(VALUE_DTYPE))
+
+    with open(path, "wb") as binary_file:
+        binary_file.write(
+            HEADER.pack(MAGIC, VERSION, LAYOUTS[layout], num_rows, NUM_CELLS)
+        )
+        for block in blocks:
+            content = block.tobytes()
+            binary_file.write(content)
+            binary_file.write(b"\0" * (_padded(len(content)) - len(content)))
+
+
+def read_header(path: str):
+    """Read the header of a binary table file.
+
+    Args:
+        path (str): path of the binary file
+
+    Raises:
+        ValueError: raise Error if the file is not a binary table file
+
+    Returns:
+        tuple[int, int, int]: layout, number of rows and number of actions
+    """
+    with open(path, "rb") as binary_file:
+        magic, version, layout, num_rows, num_actions = HEADER.unpack(
+            binary_file.read(HEADER.size)
+        )
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a binary table file")
+    return layout, num_rows, num_actions
+
+
+def load_table(path: str, mmap_mode: str = "r"):
+    """Load a Q-function or a policy saved with `save_table` by memory-mapping it.
+
+    Nothing is read before values are accessed and pages are shared between
+    processes which load the same file.
+
+    Args:
+        path (str): path of the binary file
+        mmap_mode (str, optional): mode of `np.memmap`: `'r'` for read-only, `'c'` for
+                                    copy-on-write (values can be updated in memory but the
+                                    file is unchanged) or `'r+'` for writing back to the file.
+                                    Defaults to `'r'`.
+
+    Returns:
+        DenseQTable | SparseTable: `DenseQTable` for the dense layout, read-only `SparseTable`
+                                    for the sparse layout
+    """
+    layout, num_rows, num_actions = read_header(path)
+    offset = HEADER.size
+    if layout == DENSE:
+        values = np.memmap(
+            path, VALUE_DTYPE, mmap_mode, offset, shape=(num_rows, num_actions)
+        )
+        offset += _padded(values.nbytes)
+        visited = np.memmap(path, np.bool_, mmap_mode, offset, shape=(num_rows,))
+        return DenseQTable(values, visited)
+
+    codes = np.memmap(path, CODE_DTYPE, "r", offset, shape=(num_rows,))
+    offset += _padded(codes.nbytes)
+    values = np.memmap(
+        path, VALUE_DTYPE, mmap_mode, offset, shape=(num_rows, num_actions)
+    )
+    return SparseTable(codes, values)
+
+
+def patch_table(path: str, data: Mapping):
+    """Update some rows of a binary table file in place.
+
+    Args:
+        path (str): path of the binary file
+        data (Mapping): new values of the rows to update, with states as keys. A sparse
+                        table is rewritten if some states are not in the file yet.
+    """
+    table = load_table(path, "r+")
+    if isinstance(table, DenseQTable):
+        for state, value in data.items():
+            table[state] = value
+        table.values.flush()
+        table.visited.flush()
+        return
+
+    if all(state in table for state in data):
+        for state, value in data.items():
+            table.values[table._index(state)] = value
+        table.values.flush()
+    else:
+        merged = {state: np.array(value) for state, value in table.items()}
+        merged.update(data)
+        del table
+        save_table(merged, path, "sparse")
+
+
+def convert_json(json_path: str, path: str = None, layout: str = "dense"):
+    """Convert a json file of a Q-function or a policy into the binary format.
+
+    Args:
+        json_path (str): path of the json file
+        path (str, optional): path of the binary file. Defaults to None. If None is given,
+                                the json path with the `.qtab` extension will be used.
+        layout (str, optional): either `'dense'` or `'sparse'`. Defaults to `'dense'`.
+
+    Returns:
+        str: path of the binary file
+    """
+    if path is None:
+        path = os.path.splitext(json_path)[0] + ".qtab"
+    save_table(read_json(json_path), path, layout)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert json Q-functions and policies into binary tables."
+    )
+    parser.add_argument("json_paths", nargs="+", metavar="JSON")
+    parser.add_argument("--layout", choices=tuple(LAYOUTS), default="dense")
+    args = parser.parse_args()
+    for json_path in args.json_paths:
+        print(json_path, "->", convert_json(json_path, layout=args.layout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+from typing import *
+
+from back.utils import NUM_CELLS, code_to_state
+from back.qtable import STATE_DIGITS, STATE_CODE_WEIGHTS
+
+
+def _permutations():
+    """Cell permutations of the 8 symmetries (rotations and reflections) of the board.
+
+    For a permutation `p`, the transformed board is given by `board[p]`, i.e. the
+    cell `i` of the transformed board is the cell `p[i]` of the original one.
+
+    Returns:
+        np.ndarray: `8 x 9` array of permutations, the first one being the identity
+    """
+    cells = np.arange(NUM_CELLS).reshape(3, 3)
+    permutations = []
+    for board in (cells, cells.T):  # transpose gives the reflections
+        for quarter_turns in range(4):
+            permutations.append(np.rot90(board, quarter_turns).flatten())
+    return np.array(permutations)
+
+
+PERMUTATIONS = _permutations()
+INVERSE_PERMUTATIONS = np.argsort(PERMUTATIONS, axis=-1)
+
+
+def _canonical_tables():
+    """Canonical representative (smallest code among the 8 symmetric boards) of every
+    state code, and the symmetry which transforms the state into it.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: canonical codes and indices of the symmetries
+    """
+    codes = np.stack(
+        [
+            STATE_DIGITS[:, permutation] @ STATE_CODE_WEIGHTS
+            for permutation in PERMUTATIONS
+        ],
+        axis=-1,
+    )
+    transforms = codes.argmin(axis=-1)
+    return codes.min(axis=-1), transforms
+
+
+CANONICAL_CODES, CANONICAL_TRANSFORMS = _canonical_tables()
+
+
+def canonicalize(state: str):
+    """Map a state to its canonical representative among its rotations and reflections.
+
+    Args:
+        state (str): hashed state
+
+    Returns:
+        tuple[str, int]: canonical state and index of the symmetry which transforms
+                        `state` into it
+    """
+    code = int(state, 3)
+    return code_to_state(int(CANONICAL_CODES[code])), int(CANONICAL_TRANSFORMS[code])
+
+
+def to_canonical_action(action: int, transform: int):
+    """Map an action on a state to the same action on its transformed state.
+
+    Args:
+        action (int): action on the original state
+        transform (int): index of the symmetry (as returned by `canonicalize`)
+
+    Returns:
+        int: action on the transformed state
+    """
+    return int(INVERSE_PERMUTATIONS[transform, action])
+
+
+def from_canonical_action(action: int, transform: int):
+    """Map an action on a transformed state back to the original state.
+
+    Args:
+        action (int): action on the transformed state
+        transform (int): index of the symmetry (as returned by `canonicalize`)
+
+    Returns:
+        int: action on the original state
+    """
+    return int(PERMUTATIONS[transform, action])
+
+
+def from_canonical_values(values: Sequence[float], transform: int):
+    """Map values (Q-values or probabilities) of the actions on a transformed state
+    back to the actions of the original state.
+
+    Args:
+        values (Sequence[float]): `1-D` values of each action on the transformed state
+        transform (int): index of the symmetry (as returned by `canonicalize`)
+
+    Returns:
+        np.ndarray: values of each action on the original state
+    """
+    return np.asarray(values)[INVERSE_PERMUTATIONS[transform]]
+
+
+def expand_policy(policy: Mapping):
+    """Generate a policy on all states from a policy on canonical states.
+
+    Args:
+        policy (Mapping): policy with canonical states as keys
+
+    Returns:
+        dict: policy with every symmetric state of the canonical states as keys
+    """
+    expanded = {}
+    for canonical_state, proba in policy.items():
+        digits = np.array([int(char) for char in canonical_state])
+        for permutation in INVERSE_PERMUTATIONS:
+            state = "".join(map(str, digits[permutation]))
+            if state not in expanded:
+                _, transform = canonicalize(state)
+                expanded[state] = from_canonical_values(proba, transform).tolist()
+    return expanded
@@ -6,6 +6,11 @@ Created on Mon Sep  5 18:09:47 2022
 @author: heritianadanielandriasolofo
 """
 
+import copy
+import numpy as np
+
+from back.utils import code_to_state
+
 
 class TicTacToe:
     def __init__(self) -> None:
@@ -104,6 +109,20 @@ class TicTacToe:
         self.val *= -1
         return True, reward
 
+    def legal_actions(self):
+        """Allowed actions of current player (none if the game is over).
+
+        Returns:
+            tuple[int]: allowed actions
+        """
+        if self.end:
+            return ()
+        return tuple(
+            action
+            for action, (row, col) in self.actions.items()
+            if self.board[row][col] == 0
+        )
+
     @property
     def hashed_state(self):
         """generate a hashed string for current state.
@@ -148,3 +167,337 @@ class TicTacToe:
         """
         switch, reward = self.play(*self.actions[action])
         return self.hashed_state, reward, self.end, switch
+
+
+# Bit `i` of a bitboard is set when the player occupies cell `i` (action `i`).
+# Lines are ordered as the `color` slots: 3 rows, 3 columns, diagonal, antidiagonal.
+WIN_MASKS = (
+    0b000000111,
+    0b000111000,
+    0b111000000,
+    0b001001001,
+    0b010010010,
+    0b100100100,
+    0b100010001,
+    0b001010100,
+)
+# lines (color slot, mask) going through each cell
+LINES_THROUGH_CELL = tuple(
+    tuple((line, mask) for line, mask in enumerate(WIN_MASKS) if mask >> cell & 1)
+    for cell in range(9)
+)
+# allowed actions for each 9-bit mask of empty cells
+ACTIONS_OF_EMPTY_CELLS = tuple(
+    tuple(cell for cell in range(9) if empty >> cell & 1) for empty in range(1 << 9)
+)
+# increment of the state code when player 1 (digit 1) or player 2 (digit 2) fills a cell
+CELL_CODE_INCREMENTS = tuple(
+    tuple(digit * 3 ** (8 - cell) for cell in range(9)) for digit in (1, 2)
+)
+
+
+class BitboardTicTacToe:
+    def __init__(self) -> None:
+        """Generate a Tic Tac Toe Game environment backed by bitboards.
+
+        It is a drop-in replacement of `TicTacToe`: marks of each player are kept
+        as two 9-bit integers, wins are checked against the precomputed masks of
+        the lines going through the last move and the integer code of the state
+        (see `back.utils.state_to_code`) is updated incrementally.
+        """
+        self.actions = {action: divmod(action, 3) for action in range(9)}
+        self.num_actions = 9
+        self.reset()
+
+    def whose_turn(self):
+        """Ask the environment the index of current player
+
+        Returns:
+            int: index of current player
+        """
+        return 0 if self.val == 1 else 1
+
+    def legal_actions(self):
+        """Allowed actions of current player (none if the game is over).
+
+        Returns:
+            tuple[int]: allowed actions
+        """
+        if self.end:
+            return ()
+        return ACTIONS_OF_EMPTY_CELLS[~(self.marks[0] | self.marks[1]) & 0b111111111]
+
+    @property
+    def board(self):
+        """Board as a list of rows, with 1 for player 1, -1 for player 2 and 0 for empty.
+
+        Returns:
+            list[list[int]]: current board
+        """
+        marks1, marks2 = self.marks
+        return [
+            [
+                (marks1 >> cell & 1) - (marks2 >> cell & 1)
+                for cell in range(3 * row, 3 * row + 3)
+            ]
+            for row in range(3)
+        ]
+
+    def get_reward(self, action: int):
+        """Check wether the game is ended after current player played at the given cell
+        and return the respected reward.
+
+        Args:
+            action (int): cell where player plays
+
+        Returns:
+            int: reward obtain by playing at the given cell
+        """
+        marks = self.marks[self.whose_turn()]
+        reward = 0
+        if self.number_of_empty == 0:
+            self.end = True
+            self.winner = None
+        for line, mask in LINES_THROUGH_CELL[action]:
+            if marks & mask == mask:
+                self.color[line] = self.val
+                self.end = True
+                self.winner = self.whose_turn()
+                reward += 1
+        return reward
+
+    def play_action(self, action: int):
+        """Current player plays at the given cell.
+
+        Args:
+            action (int): index of the cell where player want to play
+
+        Returns:
+            tuple[bool, int]: indication wether player was able to play at the given position, reward obtain by trying to play on the position
+        """
+        if self.end:
+            return False, -sum(self.color)
+        bit = 1 << action
+        if (self.marks[0] | self.marks[1]) & bit:
+            return False, -1  # penalize on typing on filled slot
+
+        hand = self.whose_turn()
+        self.marks[hand] |= bit
+        self.state_code += CELL_CODE_INCREMENTS[hand][action]
+        self.number_of_empty -= 1
+        reward = self.get_reward(action)
+        # switch player
+        self.val *= -1
+        return True, reward
+
+    def play(self, row: int, col: int):
+        """Current player plays at the given row and column.
+
+        Args:
+            row (int): row where player want to play
+            col (int): column where player want to play
+
+        Returns:
+            tuple[bool, int]: indication wether player was able to play at the given position, reward obtain by trying to play on the position
+        """
+        return self.play_action(3 * row + col)
+
+    @property
+    def hashed_state(self):
+        """generate a hashed string for current state.
+
+        Returns:
+            str : hash for current state
+        """
+        return code_to_state(self.state_code)
+
+    @property
+    def winning_cells(self):
+        """Cells of the completed lines.
+
+        Returns:
+            set[int]: indexes of the cells of the completed lines
+        """
+        cells = set()
+        for line, mask in enumerate(WIN_MASKS):
+            if self.color[line]:
+                cells.update(cell for cell in range(9) if mask >> cell & 1)
+        return cells
+
+    def clone(self):
+        """Independent copy of the environment (e.g. to simulate games from the current state).
+
+        Returns:
+            BitboardTicTacToe: the copy
+        """
+        environment = copy.copy(self)
+        environment.marks = list(self.marks)
+        environment.color = list(self.color)
+        return environment
+
+    def reset(self):
+        """Reset environement:
+        - Set hand to plalyer 1
+        - Clear and uncolor the board
+
+        Returns:
+            str : empty state
+        """
+        self.val = 1
+        self.marks = [0, 0]
+        self.state_code = 0
+        self.number_of_empty = 9
+        self.color = [0] * 8
+        self.end = False
+        self.winner = None
+        return self.hashed_state
+
+    def step(self, action: int):
+        """Make a step in the environement by performing an action.
+        Actions are represented in a index form (from 0 to 8) as in `TicTacToe.step`.
+
+        Args:
+            action (int): index of the action to perform.
+
+        Returns:
+            tuple[str, int, bool, bool]: hashed of next state, reward from the action, indication if the game is done, indication if the player will be switched
+        """
+        switch, reward = self.play_action(action)
+        return self.hashed_state, reward, self.end, switch
+
+
+# cells of each line, ordered as the `color` slots
+LINES = np.array(
+    [[cell for cell in range(9) if mask >> cell & 1] for mask in WIN_MASKS]
+)
+
+
+class BatchTicTacToe:
+    def __init__(self, num_envs: int, max_step: int = 100) -> None:
+        """Generate `num_envs` Tic Tac Toe Game environments played in lockstep.
+
+        Boards are stored in a `(num_envs, 9)` array with 1 for player 1, -1 for
+        player 2 and 0 for empty cells. Every board follows the rules of
+        `TicTacToe.step` (same rewards, same penalty on filled cells) and the
+        episodes follow the ones of `back.train_module.run_episode`: an episode is
+        finished once both players have received a `done` flag or after more than
+        `max_step` steps. Finished boards are reset automatically, their episode
+        rewards and winner being kept in `last_rewards` and `last_winners`.
+
+        Args:
+            num_envs (int): number of boards
+            max_step (int, optional): maximum step allowed for an episode. Defaults to 100.
+        """
+        self.num_envs = num_envs
+        self.max_step = max_step
+        self.num_actions = 9
+        self.actions = {action: divmod(action, 3) for action in range(9)}
+        self._code_increments = np.array(CELL_CODE_INCREMENTS, dtype=np.int64)
+
+        self.boards = np.zeros((num_envs, 9), dtype=np.int8)
+        self.val = np.ones(num_envs, dtype=np.int8)
+        self.state_codes = np.zeros(num_envs, dtype=np.int64)
+        self.number_of_empty = np.full(num_envs, 9, dtype=np.int8)
+        self.color = np.zeros((num_envs, 8), dtype=np.int8)
+        self.end = np.zeros(num_envs, dtype=bool)
+        self.winner = np.full(num_envs, -1, dtype=np.int8)  # -1 when no winner
+        self.n_steps = np.zeros(num_envs, dtype=np.int64)
+        self.dones = np.zeros((num_envs, 2), dtype=bool)
+        self.episode_rewards = np.zeros((num_envs, 2), dtype=np.int64)
+        self.first_done = np.full(num_envs, -1, dtype=np.int8)
+
+        self.finished = np.zeros(num_envs, dtype=bool)
+        self.last_rewards = np.zeros((num_envs, 2), dtype=np.int64)
+        self.last_winners = np.zeros(num_envs, dtype=np.int8)
+
+    def whose_turn(self):
+        """Ask the environment the index of current player on each board
+
+        Returns:
+            np.ndarray: index of current player for each board
+        """
+        return (self.val == -1).astype(np.intp)
+
+    def reset(self, mask: np.ndarray = None):
+        """Reset the boards selected by `mask` (all boards if it is None).
+
+        Args:
+            mask (np.ndarray, optional): boolean array of the boards to reset. Defaults to None.
+
+        Returns:
+            np.ndarray: state codes of all boards
+        """
+        idx = slice(None) if mask is None else mask
+        self.boards[idx] = 0
+        self.val[idx] = 1
+        self.state_codes[idx] = 0
+        self.number_of_empty[idx] = 9
+        self.color[idx] = 0
+        self.end[idx] = False
+        self.winner[idx] = -1
+        self.n_steps[idx] = 0
+        self.dones[idx] = False
+        self.episode_rewards[idx] = 0
+        self.first_done[idx] = -1
+        return self.state_codes.copy()
+
+    def step(self, actions: np.ndarray, mask: np.ndarray = None):
+        """Make a step on every board selected by `mask` (all boards if it is None).
+
+        Args:
+            actions (np.ndarray): action (from 0 to 8) to perform on each board
+            mask (np.ndarray, optional): boolean array of the boards to step. Defaults to None.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: state codes of next states,
+                    rewards from the actions, indications if the games are done, indications
+                    if the players will be switched. Boards not selected by `mask` get a
+                    zero reward and `False` flags.
+        """
+        num_envs = self.num_envs
+        idx = np.arange(num_envs) if mask is None else np.flatnonzero(mask)
+        actions = np.asarray(actions)[idx]
+        hands = (self.val[idx] == -1).astype(np.intp)
+
+        ended = self.end[idx]
+        valid = ~ended & (self.boards[idx, actions] == 0)
+        # penalize on typing on filled slot, or on playing after the end of the game
+        step_rewards = np.where(ended, -self.color[idx].sum(axis=-1), -1)
+
+        moved, cells, movers = idx[valid], actions[valid], hands[valid]
+        self.boards[moved, cells] = self.val[moved]
+        self.state_codes[moved] += self._code_increments[movers, cells]
+        self.number_of_empty[moved] -= 1
+        # every line of the boards is checked: the game was not ended, so a complete line goes
+        # through the last move, and summing the 8 lines at once is cheaper than gathering them
+        wins = np.abs(self.boards[moved][:, LINES].sum(axis=-1)) == 3
+        self.color[moved] = np.where(wins, self.val[moved, None], 0)
+        won = wins.any(axis=-1)
+        self.end[moved] = won | (self.number_of_empty[moved] == 0)
+        self.winner[moved] = np.where(won, movers, -1)
+        self.val[moved] *= -1
+        step_rewards[valid] = wins.sum(axis=-1)
+
+        done = self.end[idx]
+        self.n_steps[idx] += 1
+        self.episode_rewards[idx, hands] += step_rewards
+        self.dones[idx, hands] = done
+        first = done & (self.first_done[idx] < 0)
+        self.first_done[idx[first]] = hands[first]
+
+        states = self.state_codes.copy()
+        rewards = np.zeros(num_envs, dtype=np.int64)
+        rewards[idx] = step_rewards
+        dones = np.zeros(num_envs, dtype=bool)
+        dones[idx] = done
+        switches = np.zeros(num_envs, dtype=bool)
+        switches[idx] = valid
+
+        self.finished[:] = False
+        self.finished[idx] = self.dones[idx].all(axis=-1) | (
+            self.n_steps[idx] > self.max_step
+        )
+        self.last_rewards[self.finished] = self.episode_rewards[self.finished]
+        self.last_winners[self.finished] = self.first_done[self.finished] + 1
+        self.reset(self.finished)
+        return states, rewards, dones, switches
@@ -0,0 +1,318 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+
+from back.tictactoe import BatchTicTacToe
+from back.qtable import DenseQTable, INITIAL_VALUES, LEGAL_MASK, STATE_DIGITS
+from back.sampler import cdf_table, sample_cdf_table
+from back.solver import perfect_policy
+from back.storage import load_table
+from back.utils import read_json, return_probabilities_batch
+
+
+def probability_table(data: Mapping, kind: str = "auto"):
+    """Dense table of the action distributions of a policy or a Q-function.
+
+    States which are not in `data` get a uniform distribution on allowed actions.
+
+    Args:
+        data (Mapping): a policy/qfunction with states as keys (dictionary or binary table)
+        kind (str, optional): `'policy'` if the values are distributions, or the kind
+                            (`'greedy'`, `'softmax'` or `'random'`) used to turn Q-values into
+                            distributions. `'auto'` reads values as distributions if every row is
+                            non negative and sums to 1, and as greedy Q-values otherwise.
+                            Defaults to `'auto'`.
+
+    Returns:
+        np.ndarray: `(3**9, 9)` array of distributions indexed by state code
+    """
+    table = INITIAL_VALUES.copy()
+    if isinstance(data, DenseQTable):
+        codes = np.flatnonzero(data.visited)
+        values = np.asarray(data.values)[codes]
+    else:
+        codes = np.array([DenseQTable.code(state) for state in data], dtype=int)
+        values = np.array([np.asarray(value) for value in data.values()], dtype=float)
+    values = values.reshape(len(codes), INITIAL_VALUES.shape[1])
+
+    if kind == "auto":
+        is_distribution = np.all(values >= 0) and np.allclose(values.sum(axis=-1), 1)
+        kind = "policy" if is_distribution else "greedy"
+    if kind != "policy":
+        values = return_probabilities_batch(STATE_DIGITS[codes], values, kind)
+    table[codes] = values
+    return table
+
+
+def load_competitor(spec: str, kind: str = "auto"):
+    """Load a competitor of a tournament.
+
+    Args:
+        spec (str): `[name=]source` where source is the path of a json file or a binary table
+                    (`.qtab`) of a policy or a Q-function, `random` (uniform on allowed actions)
+                    or `perfect` (policy of the solver). The name defaults to the file name.
+        kind (str, optional): how values are read (see `probability_table`). Defaults to `'auto'`.
+
+    Returns:
+        tuple[str, np.ndarray]: name and cumulative table of the competitor (see `cdf_table`)
+    """
+    name, _, source = spec.rpartition("=")
+    if not name:
+        name = os.path.splitext(os.path.basename(source))[0]
+    if source == "random":
+        table = INITIAL_VALUES
+    elif source == "perfect":
+        table = probability_table(perfect_policy(), "policy")
+    elif source.endswith(".qtab"):
+        table = probability_table(load_table(source), kind)
+    else:
+        table = probability_table(read_json(source, return_as_array=True), kind)
+    return name, cdf_table(table, LEGAL_MASK)
+
+
+def play_games(
+    first: np.ndarray,
+    second: np.ndarray,
+    num_games: int,
+    seed: Union[int, np.random.SeedSequence] = None,
+    num_envs: int = 4096,
+):
+    """Play games between two competitors on a batch environment.
+
+    Args:
+        first (np.ndarray): cumulative table of the competitor who plays first
+        second (np.ndarray): cumulative table of the competitor who plays second
+        num_games (int): number of games
+        seed (int | np.random.SeedSequence, optional): seed of the games. Defaults to None.
+        num_envs (int, optional): number of boards played at once. Defaults to 4096.
+
+    Returns:
+        np.ndarray: number of [draws, first player wins, second player wins]
+    """
+    generator = np.random.default_rng(seed)
+    num_envs = min(num_envs, num_games)
+    environment = BatchTicTacToe(num_envs)
+    tables = (first, second)
+    results = np.zeros(3, dtype=np.int64)
+    active = np.ones(num_envs, dtype=bool)
+    started = num_envs
+    actions = np.zeros(num_envs, dtype=np.intp)
+    while active.any():
+        codes = environment.state_codes
+        hands = environment.whose_turn()
+        uniforms = generator.random(num_envs)
+        for hand, table in enumerate(tables):
+            boards = np.flatnonzero(active & (hands == hand))
+            actions[boards] = sample_cdf_table(table, codes[boards], uniforms[boards])
+        _, _, dones, _ = environment.step(actions, active)
+
+        ended = np.flatnonzero(dones)
+        results += np.bincount(environment.winner[ended] + 1, minlength=3)
+        environment.reset(dones)
+        restarted = min(len(ended), num_games - started)
+        started += restarted
+        active[ended[restarted:]] = False
+    return results
+
+
+_tables = None
+
+
+def _init_worker(tables: list):
+    global _tables
+    _tables = tables
+
+
+def _play_worker(first: int, second: int, num_games: int, seed: np.random.SeedSequence):
+    return first, second, play_games(_tables[first], _tables[second], num_games, seed)
+
+
+def wilson_interval(successes: int, trials: int, z: float = 1.96):
+    """Wilson score confidence interval of a proportion.
+
+    Args:
+        successes (int): number of successes
+        trials (int): number of trials
+        z (float, optional): quantile of the normal distribution. Defaults to 1.96 (95%).
+
+    Returns:
+        tuple[float, float]: lower and upper bounds
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    proportion = successes / trials
+    denominator = 1 + z**2 / trials
+    center = (proportion + z**2 / (2 * trials)) / denominator
+    half_width = (
+        z
+        * math.sqrt(proportion * (1 - proportion) / trials + z**2 / (4 * trials**2))
+        / denominator
+    )
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def round_robin(
+    tables: list,
+    num_games: int,
+    num_workers: int = None,
+    chunk_size: int = 100000,
+    seed: int = None,
+):
+    """Play every ordered pair of different competitors.
+
+    Args:
+        tables (list): cumulative tables of the competitors
+        num_games (int): number of games of each ordered pair (i.e. for each seat)
+        num_workers (int, optional): number of processes. Defaults to None (number of CPUs).
+        chunk_size (int, optional): number of games of each task. Defaults to 100000.
+        seed (int, optional): seed of the tournament. Defaults to None.
+
+    Returns:
+        np.ndarray: `(n, n, 3)` array where `[i, j]` holds the number of [draws, wins of i,
+                    wins of j] when `i` plays first against `j`
+    """
+    n = len(tables)
+    tasks = [
+        (first, second, min(chunk_size, num_games - start))
+        for first, second in itertools.permutations(range(n), 2)
+        for start in range(0, num_games, chunk_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    results = np.zeros((n, n, 3), dtype=np.int64)
+    with ProcessPoolExecutor(
+        num_workers, initializer=_init_worker, initargs=(tables,)
+    ) as executor:
+        futures = [
+            executor.submit(_play_worker, *task, task_seed)
+            for task, task_seed in zip(tasks, seeds)
+        ]
+        for future in futures:
+            first, second, counts = future.result()
+            results[first, second] += counts
+    return results
+
+
+def summarize(names: list, results: np.ndarray, z: float = 1.96):
+    """Win, draw and loss counts of each competitor against each other over both seats.
+
+    Args:
+        names (list): names of the competitors
+        results (np.ndarray): results given by `round_robin`
+        z (float, optional): quantile of the confidence intervals. Defaults to 1.96 (95%).
+
+    Returns:
+        dict: for each pair `"<name> vs <opponent>"`: number of `games`, `wins`, `draws`,
+                `losses`, their rates and confidence intervals, and the results by seat
+    """
+    summary = {}
+    for i, j in itertools.permutations(range(len(names)), 2):
+        as_first, as_second = results[i, j], results[j, i]
+        wins = int(as_first[1] + as_second[2])
+        losses = int(as_first[2] + as_second[1])
+        draws = int(as_first[0] + as_second[0])
+        games = wins + draws + losses
+        entry = {"games": games, "wins": wins, "draws": draws, "losses": losses}
+        for outcome in ("wins", "draws", "losses"):
+            entry[f"{outcome}_rate"] = entry[outcome] / games if games else 0.0
+            entry[f"{outcome}_interval"] = wilson_interval(entry[outcome], games, z)
+        entry["as_first"] = dict(zip(("draws", "wins", "losses"), map(int, as_first)))
+        entry["as_second"] = dict(zip(("draws", "losses", "wins"), map(int, as_second)))
+        summary[f"{names[i]} vs {names[j]}"] = entry
+    return summary
+
+
+def format_matrices(names: list, summary: dict):
+    """Text tables of the win, draw and loss rates (row player against column player)
+    with the half width of their confidence intervals."""
+    width = max(12, *(len(name) + 2 for name in names))
+    lines = []
+    for outcome in ("wins", "draws", "losses"):
+        lines.append(f"\n{outcome.upper()} (row vs column, %)")
+        lines.append(" " * width + "".join(f"{name:>{width}}" for name in names))
+        for row in names:
+            cells = []
+            for column in names:
+                if row == column:
+                    cells.append(f"{'-':>{width}}")
+                    continue
+                entry = summary[f"{row} vs {column}"]
+                low, high = entry[f"{outcome}_interval"]
+                rate = 100 * entry[f"{outcome}_rate"]
+                cells.append(f"{rate:.2f}±{100 * (high - low) / 2:.2f}".rjust(width))
+            lines.append(f"{row:<{width}}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Round-robin tournament between policies and Q-functions."
+    )
+    parser.add_argument(
+        "competitors",
+        nargs="+",
+        metavar="[NAME=]SOURCE",
+        help="json or .qtab file of a policy or a Q-function, 'random' or 'perfect'",
+    )
+    parser.add_argument(
+        "--games", type=int, default=100000, help="games of each pair for each seat"
+    )
+    parser.add_argument(
+        "--kind",
+        choices=("auto", "policy", "greedy", "softmax", "random"),
+        default="auto",
+        help="how values of the files are read",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", default=None, help="save the summary in a json file")
+    parser.add_argument(
+        "--gate",
+        default=None,
+        metavar="NAME",
+        help="exit with status 1 if NAME loses significantly often against an opponent",
+    )
+    parser.add_argument(
+        "--max-loss-rate",
+        type=float,
+        default=0.0,
+        help="loss rate allowed by --gate (compared with the lower confidence bound)",
+    )
+    args = parser.parse_args()
+
+    names, tables = zip(
+        *(load_competitor(spec, args.kind) for spec in args.competitors)
+    )
+    if len(set(names)) != len(names):
+        parser.error("competitors must have different names")
+    results = round_robin(
+        list(tables), args.games, args.workers, args.chunk_size, args.seed
+    )
+    summary = summarize(names, results)
+    print(format_matrices(names, summary))
+    if args.json is not None:
+        with open(args.json, "w") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+    if args.gate is not None:
+        if args.gate not in names:
+            parser.error(f"unknown competitor {args.gate}")
+        failures = [
+            pair
+            for pair, entry in summary.items()
+            if pair.startswith(f"{args.gate} vs ")
+            and entry["losses_interval"][0] > args.max_loss_rate
+        ]
+        for pair in failures:
+            print(f"\nGATE FAILED: {pair} loses {summary[pair]['losses']} games")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
-from back.player_module import Player, HumanPlayer
-from back.tictactoe import TicTacToe
+from back.player_module import Player, HumanPlayer, QAgent
+from back.tictactoe import TicTacToe, BatchTicTacToe
+from back.qtable import DenseQTable
+from back.symmetry import canonicalize, to_canonical_action
+from back.utils import NUM_STATES, code_to_state
+from back.sampler import Sampler
+from back.instrumentation import Instrumentation, profiled
+from back.metrics import MetricsLog, read_metrics
+from back.checkpoint import snapshot, write_checkpoint, load_checkpoint, restore
+from back.persistence import PersistenceService
 
+from concurrent.futures import ProcessPoolExecutor
 from typing import *
+import os
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
@@ -14,6 +25,8 @@ def run_episode(
     eval1: bool = False,
     eval2: bool = False,
     max_step: int = 100,
+    illegal_move: str = "penalize",
+    instrumentation: Instrumentation = None,
 ):
     """Runing episode between two adgents players.
 
@@ -28,12 +41,26 @@ def run_episode(
                         If it is an evaluation, then player2 will play greedily, otherwise
                         epsilon-greedy with update. Defaults to False i.e. training.
         max_step (int, optional): maximum step allowed for the episode. Defaults to 100.
+        illegal_move (str, optional): what to do when a player chooses a filled cell:
+                        - `'penalize'`: the move is rejected with a -1 reward and the player plays again
+                        - `'random'`: the move is replaced by a random allowed move
+                        - `'raise'`: a `ValueError` is raised
+                        Defaults to `'penalize'`.
+        instrumentation (Instrumentation, optional): instrumentation recording the time spent
+                        acting, stepping and updating, illegal moves, episode length and Q-function
+                        misses/insertions. Defaults to None (nothing is recorded).
+
+    Raises:
+        NotImplementedError: raise Error if illegal_move is not one of `'penalize'`, `'random'` and `'raise'`
+        ValueError: raise Error if a player chooses a filled cell and illegal_move is `'raise'`
 
     Returns:
         tuple(list[int,int], int): where the list will contain the reward of player1 and player2
                                     respectedly during the episode. The second element is an
                                     integer (1 or 2) value of the  winner. It will be 0 if it is a draw.
     """
+    if illegal_move not in ("penalize", "random", "raise"):
+        raise NotImplementedError
     state = environment.reset()
     n_steps = 0
     players = [player1, player2]
@@ -43,16 +70,41 @@ def run_episode(
     done = False
     p = 0
     winners = []
+    if instrumentation is not None:
+        snapshot = instrumentation.start_episode(players)
     while True:
         eval = evals[p]
+        if instrumentation is not None:
+            start = time.perf_counter()
         if done and isinstance(players[p], HumanPlayer):
             action = 0
         else:
             action = players[p].act(state, eval=eval)
+            if illegal_move != "penalize" and not environment.end:
+                legal_actions = environment.legal_actions()
+                if action not in legal_actions:
+                    if illegal_move == "raise":
+                        raise ValueError(f"Action {action} is not allowed at {state}")
+                    action = legal_actions[np.random.randint(len(legal_actions))]
+                    if instrumentation is not None:
+                        instrumentation.count("illegal_moves")
+        if instrumentation is not None:
+            ended = environment.end
+            now = time.perf_counter()
+            instrumentation.add_time("act", now - start)
+            start = now
         next_state, reward, done, switch = environment.step(action)
+        if instrumentation is not None:
+            if not (switch or ended):
+                instrumentation.count("illegal_moves")
+            now = time.perf_counter()
+            instrumentation.add_time("step", now - start)
+            start = now
 
         if not eval:
             players[p].update(state, action, next_state, reward, done)
+            if instrumentation is not None:
+                instrumentation.add_time("update", time.perf_counter() - start)
         rewards[p] += reward
         dones[p] = done
         if done:
@@ -63,10 +115,148 @@ def run_episode(
             break
         if switch:  # do not pass the hand until player put in an empty place
             p = int(not p)
+    if instrumentation is not None:
+        instrumentation.end_episode(players, snapshot, n_steps)
     winner = winners[0] if winners else 0
     return rewards, winner
 
 
+def run_episodes_batched(
+    player1: Player,
+    player2: Player,
+    environment: BatchTicTacToe,
+    num_episodes: int,
+    eval1: bool = False,
+    eval2: bool = False,
+):
+    """Runing `num_episodes` episodes between two agents players on the boards of a batch environment.
+
+    Each board plays its own episode as in `run_episode`, and is reused for a new
+    episode once finished until `num_episodes` episodes are played. A `batched` `QAgent`
+    (dense Q-table, see `QAgent.act_batch`) acts and learns on all its boards at once;
+    other players are called once per board, which is not faster than `run_episode`.
+    Batched updates of a step are all computed from the Q-values before the step.
+
+    Args:
+        player1 (Player): first QAgent player
+        player2 (Player): second QAgent player
+        environment (BatchTicTacToe): the batch environment where the two agents will play.
+                        Its `max_step` is used as maximum step allowed for each episode.
+        num_episodes (int): number of episodes to run
+        eval1 (bool, optional): flag saying wether player1 is in an evaluation or training mode.
+                        If it is an evaluation, then player1 will play greedily, otherwise
+                        epsilon-greedy with update. Defaults to False i.e. training.
+        eval2 (bool, optional): flag saying wether player2 is in an evaluation or training mode.
+                        If it is an evaluation, then player2 will play greedily, otherwise
+                        epsilon-greedy with update. Defaults to False i.e. training.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray): `num_episodes x 2` array of rewards of player1 and player2
+                                    for each episode and array of winners (1 or 2) of each episode,
+                                    0 being a draw, as returned by `run_episode`.
+    """
+    players = (player1, player2)
+    evals = (eval1, eval2)
+    num_envs = environment.num_envs
+    all_rewards = np.zeros((num_episodes, 2), dtype=np.int64)
+    winners = np.zeros(num_episodes, dtype=np.int64)
+
+    batched = [getattr(player, "batched", False) for player in players]
+
+    environment.reset()
+    started = min(num_envs, num_episodes)
+    active = np.arange(num_envs) < started
+    episode_index = np.arange(num_envs)
+    actions = np.zeros(num_envs, dtype=np.intp)
+    while active.any():
+        codes = environment.state_codes.copy()
+        hands = environment.whose_turn()
+        boards = [np.flatnonzero(active & (hands == p)) for p in range(2)]
+        for p, player in enumerate(players):
+            if batched[p]:
+                actions[boards[p]] = player.act_batch(codes[boards[p]], eval=evals[p])
+            else:
+                for i in boards[p]:
+                    actions[i] = player.act(code_to_state(codes[i]), eval=evals[p])
+
+        next_codes, rewards, dones, _ = environment.step(actions, active)
+
+        for p, player in enumerate(players):
+            if evals[p]:
+                continue
+            if batched[p]:
+                idx = boards[p]
+                player.update_batch(
+                    codes[idx], actions[idx], next_codes[idx], rewards[idx], dones[idx]
+                )
+            else:
+                for i in boards[p]:
+                    player.update(
+                        code_to_state(codes[i]),
+                        actions[i],
+                        code_to_state(next_codes[i]),
+                        rewards[i],
+                        dones[i],
+                    )
+        for i in np.flatnonzero(environment.finished):
+            all_rewards[episode_index[i]] = environment.last_rewards[i]
+            winners[episode_index[i]] = environment.last_winners[i]
+            if started < num_episodes:
+                episode_index[i] = started
+                started += 1
+            else:
+                active[i] = False
+    return all_rewards, winners
+
+
+def evaluate(
+    player1: Player,
+    player2: Player,
+    environment: TicTacToe,
+    num_eval_episodes: int,
+    max_step: int = 100,
+    illegal_move: str = "penalize",
+):
+    """Run greedy episodes between two players for evaluation.
+
+    Args:
+        player1 (Player): first player
+        player2 (Player): second player
+        environment (TicTacToe): the tic tac toe environment where the two agents will play
+        num_eval_episodes (int): number of episode for the evaluation
+        max_step (int, optional): maximum step allowed for the episode. Defaults to 100
+        illegal_move (str, optional): handling of illegal moves (see `run_episode`). Defaults to `'penalize'`.
+
+    Returns:
+        tuple[np.ndarray, list]: average reward of player1 and player2 and number of [draw, player1 wins, player2 wins]
+    """
+    rewards_list = []
+    winners_list = [0, 0, 0]
+    for _ in range(num_eval_episodes):
+        rewards, winner = run_episode(
+            player1,
+            player2,
+            environment,
+            eval1=True,
+            eval2=True,
+            max_step=max_step,
+            illegal_move=illegal_move,
+        )
+        rewards_list.append(rewards)
+        winners_list[winner] += 1
+    return np.mean(rewards_list, axis=0), winners_list
+
+
+def _require_tictactoe(environment, feature: str):
+    """Raise a `ValueError` if the environment is not the 3x3 tic tac toe game (whose hashed
+    states are strings), which `feature` requires."""
+    if not isinstance(environment.hashed_state, str):
+        raise ValueError(
+            f"{feature}: only the 3x3 tic tac toe game (string hashed states) is "
+            f"supported, not {type(environment).__name__}"
+        )
+
+
 def train(
     player1: Player,
     player2: Player,
@@ -77,6 +267,14 @@ def train(
     eval1: bool = False,
     eval2: bool = False,
     max_step: int = 100,
+    illegal_move: str = "penalize",
+    instrumentation: Instrumentation = None,
+    profile_path: str = None,
+    metrics_path: str = None,
+    checkpoint_path: str = None,
+    checkpoint_every: int = None,
+    resume_from: str = None,
+    num_envs: int = None,
 ):
     """Train QAgent player
 
@@ -94,61 +292,420 @@ def train(
                         If it is an evaluation, then player2 will play greedily, otherwise
                         epsilon-greedy with update. Defaults to False i.e. training.
         max_step (int, optional): maximum step allowed for the episode. Defaults to 100
+        illegal_move (str, optional): handling of illegal moves (see `run_episode`). Defaults to `'penalize'`.
+        instrumentation (Instrumentation, optional): instrumentation recording timers and counters
+                        of the training episodes (see `run_episode`), the time spent in evaluations
+                        and the size of the Q-functions at each evaluation. Defaults to None.
+        profile_path (str, optional): if it is given, the training runs under `cProfile` and the
+                        statistics are dumped in this `pstats` file. Defaults to None.
+        metrics_path (str, optional): if it is given, the result of each evaluation is appended to
+                        this csv log (see `back.metrics.MetricsLog`) instead of being kept in memory.
+                        Defaults to None.
+        checkpoint_path (str, optional): if it is given, a checkpoint of the training (Q-functions and
+                        parameters of the players, random states, episode counter and metrics) is
+                        written in this file on a background thread (see `back.checkpoint`).
+                        Defaults to None.
+        checkpoint_every (int, optional): episode period for checkpoints. A checkpoint is also written
+                        after the last episode. Defaults to None. If None is given, `eval_every_N` is used.
+        resume_from (str, optional): path of a checkpoint of the same training. If it is given, the
+                        players are restored from it and the training continues from its episode
+                        exactly as if it was never stopped. Defaults to None.
+        num_envs (int, optional): if it is given, the training episodes between two evaluations or
+                        checkpoints are played by `run_episodes_batched` on `num_envs` boards of a
+                        `BatchTicTacToe`, which is much faster for `batched` Q-agents (dense Q-tables).
+                        Their illegal moves are penalized and `instrumentation` only records the
+                        evaluations. Evaluations still use `environment`. Defaults to None.
+
+    Raises:
+        ValueError: raise Error if checkpoints or `num_envs` are asked for another game than 3x3
+                        tic tac toe (e.g. `KInARow`), or if `num_envs` is given with a human player
+                        or another `illegal_move` than `'penalize'`
 
     Returns:
         tuple[list, np.ndarray, np.darray]: - list of episodes number during evaluation
-                                            - 2-d array of average reward for each evaluation
-                                            - 2-d array of average number of [draw, player1 wins, player2 wins]
+                                            - `2xn` array of average reward of player1 and player2 for each evaluation
+                                            - `3xn` array of number of [draw, player1 wins, player2 wins]
                                             for each evaluation during training
+                                            If `metrics_path` is given, they are read back from the log
+                                            (see `read_metrics`).
     """
+    if checkpoint_path is not None or resume_from is not None:
+        _require_tictactoe(environment, "checkpoints")
     there_is_a_human_player = isinstance(player1, HumanPlayer) or isinstance(
         player2, HumanPlayer
     )
+    batch_environment = None
+    if num_envs is not None:
+        _require_tictactoe(environment, "num_envs")
+        if there_is_a_human_player or illegal_move != "penalize":
+            raise ValueError(
+                "num_envs: batched episodes need two cpu players and illegal_move='penalize'"
+            )
+        batch_environment = BatchTicTacToe(num_envs, max_step)
+        batched_until = 0  # first episode which is not played yet
     all_rewards = []
     episodes = []
     winners = []
+    first_episode = 0
+    if resume_from is not None:
+        first_episode, metrics = restore(
+            load_checkpoint(resume_from), (player1, player2), metrics_path
+        )
+        all_rewards = metrics.get("all_rewards", all_rewards)
+        episodes = metrics.get("episodes", episodes)
+        winners = metrics.get("winners", winners)
+    metrics_log = MetricsLog(metrics_path) if metrics_path is not None else None
+    checkpoints = PersistenceService(delay=0) if checkpoint_path is not None else None
+    if checkpoint_every is None:
+        checkpoint_every = eval_every_N
     print("\nYou can choose to stop training at any time by interrupting.")
     try:
-        for episode in tqdm(range(num_episodes)):
-            if there_is_a_human_player:
-                print(f"\n\n---------- Episode : {episode} ----------")
-            run_episode(
-                player1,
-                player2,
-                environment,
-                eval1=eval1,
-                eval2=eval2,
-                max_step=max_step,
-            )
-
-            if episode % eval_every_N == 0:
+        with profiled(profile_path):
+            for episode in tqdm(
+                range(first_episode, num_episodes),
+                initial=first_episode,
+                total=num_episodes,
+            ):
                 if there_is_a_human_player:
-                    print("\n-----Running evaluation-----\n")
-                rewards_list = []
-                winners_list = [0, 0, 0]
-                for _ in range(num_eval_episodes):
-                    rewards, winner = run_episode(
+                    print(f"\n\n---------- Episode : {episode} ----------")
+                if batch_environment is None:
+                    run_episode(
                         player1,
                         player2,
                         environment,
-                        eval1=True,
-                        eval2=True,
+                        eval1=eval1,
+                        eval2=eval2,
                         max_step=max_step,
+                        illegal_move=illegal_move,
+                        instrumentation=instrumentation,
+                    )
+                elif episode >= batched_until:
+                    # play every episode until the next evaluation or checkpoint at once
+                    next_evaluation = -(-episode // eval_every_N) * eval_every_N
+                    next_checkpoint = (
+                        -(-(episode + 1) // checkpoint_every) * checkpoint_every
+                    )
+                    batched_until = min(
+                        next_evaluation + 1, next_checkpoint, num_episodes
+                    )
+                    run_episodes_batched(
+                        player1,
+                        player2,
+                        batch_environment,
+                        batched_until - episode,
+                        eval1=eval1,
+                        eval2=eval2,
+                    )
+
+                if episode % eval_every_N == 0:
+                    if there_is_a_human_player:
+                        print("\n-----Running evaluation-----\n")
+                    if instrumentation is not None:
+                        start = time.perf_counter()
+                    rewards, winners_list = evaluate(
+                        player1,
+                        player2,
+                        environment,
+                        num_eval_episodes,
+                        max_step,
+                        illegal_move,
+                    )
+                    if instrumentation is not None:
+                        instrumentation.add_time(
+                            "evaluation", time.perf_counter() - start
+                        )
+                        instrumentation.record_tables(episode, (player1, player2))
+                    if metrics_log is not None:
+                        metrics_log.append(
+                            episode, num_eval_episodes, rewards, winners_list
+                        )
+                    else:
+                        winners.append(winners_list)
+                        all_rewards.append(rewards)
+                        episodes.append(episode)
+
+                if checkpoints is not None and (
+                    (episode + 1) % checkpoint_every == 0 or episode + 1 == num_episodes
+                ):
+                    if metrics_log is not None:
+                        metrics = {"metrics_size": metrics_log.size}
+                    else:
+                        metrics = {
+                            "episodes": episodes,
+                            "all_rewards": all_rewards,
+                            "winners": winners,
+                        }
+                    state = snapshot(episode + 1, (player1, player2), metrics)
+                    checkpoints.submit(
+                        checkpoint_path, lambda state=state: state, write_checkpoint
                     )
-                    rewards_list.append(rewards)
-                    winners_list[winner] += 1
-                rewards = np.mean(rewards_list, axis=-1)
-                winners.append(winners_list.copy())
-                all_rewards.append(rewards)
-                episodes.append(episode)
     except KeyboardInterrupt:
         pass
+    finally:
+        if metrics_log is not None:
+            metrics_log.close()
+        if checkpoints is not None:
+            checkpoints.close()
+
+    if metrics_log is not None:
+        return read_metrics(metrics_path)[:3]
 
     all_rewards = np.array(all_rewards).T
     winners = np.array(winners).T
     return episodes, all_rewards, winners
 
 
+class VisitCounter(Player):
+    def __init__(self, player: Player):
+        """Wrapper of a player which counts the updates of each state and action
+        of its Q-function.
+
+        Args:
+            player (Player): the wrapped player
+        """
+        self.player = player
+        self.visits = np.zeros((NUM_STATES, 9), dtype=np.int64)
+
+    def act(self, state: str, *args, **kwargs):
+        return self.player.act(state, *args, **kwargs)
+
+    def update(
+        self, state: str, action: int, next_state: str, reward: int, done: bool
+    ) -> None:
+        self.player.update(state, action, next_state, reward, done)
+        if getattr(self.player, "symmetric", False):
+            state, transform = canonicalize(state)
+            action = to_canonical_action(action, transform)
+        self.visits[int(state, 3), action] += 1
+
+
+def merge_qfunctions(qfunctions: list, visits: list = None):
+    """Merge Q-functions learned from a same starting Q-function by averaging them.
+
+    Args:
+        qfunctions (list): Q-functions (dictionaries or `DenseQTable`) to merge
+        visits (list, optional): `3**9 x 9` arrays of the number of updates of each state
+                                and action of each Q-function. Defaults to None. If they are
+                                given, Q-values are averaged with the number of updates as
+                                weights, otherwise with the same weight.
+
+    Returns:
+        dict | DenseQTable: the merged Q-function, of the same type as the first one
+    """
+    if all(isinstance(qfunction, DenseQTable) for qfunction in qfunctions):
+        values = np.stack([qfunction.values for qfunction in qfunctions])
+        merged = values.mean(axis=0)
+        if visits is not None:
+            weights = np.stack(visits).astype(float)
+            total = weights.sum(axis=0)
+            visited = total > 0
+            merged[visited] = (weights * values).sum(axis=0)[visited] / total[visited]
+        visited_states = np.any([qfunction.visited for qfunction in qfunctions], axis=0)
+        return DenseQTable(merged, visited_states)
+
+    merged = {}
+    for qfunction in qfunctions:
+        for state in qfunction:
+            if state in merged:
+                continue
+            shards = [i for i, other in enumerate(qfunctions) if state in other]
+            qvalues = np.array([qfunctions[i][state] for i in shards])
+            qvalue = qvalues.mean(axis=0)
+            if visits is not None:
+                weights = np.array([visits[i][int(state, 3)] for i in shards], float)
+                total = weights.sum(axis=0)
+                visited = total > 0
+                qvalue[visited] = (weights * qvalues).sum(axis=0)[visited] / total[
+                    visited
+                ]
+            merged[state] = qvalue
+    return merged
+
+
+def _seed_worker(seed: int, *players: Player):
+    """Seed the global generator of a worker process and give an independent sampler
+    to each player which has one, so workers never share random streams."""
+    np.random.seed(seed)
+    children = np.random.SeedSequence(seed).spawn(len(players))
+    for player, child in zip(players, children):
+        if getattr(player, "sampler", None) is not None:
+            player.sampler = Sampler(child, player.sampler.block_size)
+
+
+def _self_play_worker(
+    player1: Player,
+    player2: Player,
+    environment: TicTacToe,
+    num_episodes: int,
+    eval1: bool,
+    eval2: bool,
+    max_step: int,
+    illegal_move: str,
+    seed: int,
+):
+    """Run training episodes on local copies of the players in a worker process.
+
+    Returns:
+        tuple[Player, Player, np.ndarray, np.ndarray]: trained players and their visit counts
+    """
+    _seed_worker(seed, player1, player2)
+    counter1, counter2 = VisitCounter(player1), VisitCounter(player2)
+    for _ in range(num_episodes):
+        run_episode(
+            counter1,
+            counter2,
+            environment,
+            eval1=eval1,
+            eval2=eval2,
+            max_step=max_step,
+            illegal_move=illegal_move,
+        )
+    return player1, player2, counter1.visits, counter2.visits
+
+
+def _evaluation_worker(
+    player1: Player,
+    player2: Player,
+    environment: TicTacToe,
+    num_eval_episodes: int,
+    max_step: int,
+    illegal_move: str,
+    seed: int,
+):
+    """Run `evaluate` on a snapshot of the players in a worker process."""
+    _seed_worker(seed, player1, player2)
+    return evaluate(
+        player1, player2, environment, num_eval_episodes, max_step, illegal_move
+    )
+
+
+def train_parallel(
+    player1: QAgent,
+    player2: QAgent,
+    environment: TicTacToe,
+    num_episodes: int,
+    eval_every_N: int,
+    num_eval_episodes: int,
+    num_workers: int = None,
+    num_eval_workers: int = 1,
+    sync_every: int = 1000,
+    weighting: str = "visits",
+    eval1: bool = False,
+    eval2: bool = False,
+    max_step: int = 100,
+    illegal_move: str = "penalize",
+    seed: int = None,
+):
+    """Train QAgent players with self-play workers running in parallel processes.
+
+    Each worker trains local copies of both players for `sync_every` episodes, then
+    the Q-functions of all workers are merged into `player1` and `player2` before the
+    next round. Evaluations run in separate processes on snapshots of the players,
+    so they do not stall training.
+
+    Args:
+        player1 (QAgent): first player
+        player2 (QAgent): second player
+        environment (TicTacToe): the tic tac toe environment where the two agents will play
+        num_episodes (int): number of episodes to do for the training (over all workers)
+        eval_every_N (int): episode period for evaluation
+        num_eval_episodes (int): number of episode for each evaluation
+        num_workers (int, optional): number of self-play processes. Defaults to None i.e. number of cpus.
+        num_eval_workers (int, optional): number of evaluation processes. Defaults to 1.
+        sync_every (int, optional): number of episodes run by each worker between merges. Defaults to 1000.
+        weighting (str, optional): either `'visits'` for averaging Q-values weighted by the number of
+                                    updates of each worker, or `'uniform'` for plain averaging.
+                                    Defaults to `'visits'`.
+        eval1 (bool, optional): flag saying wether player1 is in an evaluation or training mode.
+                        If it is an evaluation, then player1 will play greedily, otherwise
+                        epsilon-greedy with update. Defaults to False i.e. training.
+        eval2 (bool, optional): flag saying wether player2 is in an evaluation or training mode.
+                        If it is an evaluation, then player2 will play greedily, otherwise
+                        epsilon-greedy with update. Defaults to False i.e. training.
+        max_step (int, optional): maximum step allowed for the episode. Defaults to 100
+        illegal_move (str, optional): handling of illegal moves (see `run_episode`). Defaults to `'penalize'`.
+        seed (int, optional): seed of the workers' random generators. Defaults to None.
+
+    Raises:
+        NotImplementedError: raise Error if weighting is not one of `'visits'` and `'uniform'`
+        ValueError: raise Error if the environment is not 3x3 tic tac toe (e.g. `KInARow`)
+
+    Returns:
+        tuple[list, np.ndarray, np.darray]: same as `train`
+    """
+    if weighting not in ("visits", "uniform"):
+        raise NotImplementedError
+    _require_tictactoe(environment, "train_parallel")
+    num_workers = num_workers or os.cpu_count()
+    seeds = np.random.default_rng(seed)
+    episodes = []
+    eval_futures = []
+    done_episodes = 0
+    print("\nYou can choose to stop training at any time by interrupting.")
+    with ProcessPoolExecutor(num_workers) as pool, ProcessPoolExecutor(
+        num_eval_workers
+    ) as eval_pool:
+        try:
+            with tqdm(total=num_episodes) as progress_bar:
+                while done_episodes < num_episodes:
+                    round_episodes = min(
+                        sync_every, -(-(num_episodes - done_episodes) // num_workers)
+                    )
+                    futures = [
+                        pool.submit(
+                            _self_play_worker,
+                            player1,
+                            player2,
+                            environment,
+                            round_episodes,
+                            eval1,
+                            eval2,
+                            max_step,
+                            illegal_move,
+                            int(seeds.integers(2**32)),
+                        )
+                        for _ in range(num_workers)
+                    ]
+                    shards1, shards2, visits1, visits2 = zip(
+                        *(future.result() for future in futures)
+                    )
+                    if weighting == "uniform":
+                        visits1 = visits2 = None
+                    player1.qfunction = merge_qfunctions(
+                        [shard.qfunction for shard in shards1], visits1
+                    )
+                    player2.qfunction = merge_qfunctions(
+                        [shard.qfunction for shard in shards2], visits2
+                    )
+
+                    previous, done_episodes = (
+                        done_episodes,
+                        done_episodes + num_workers * round_episodes,
+                    )
+                    progress_bar.update(done_episodes - previous)
+                    if previous // eval_every_N < done_episodes // eval_every_N:
+                        episodes.append(done_episodes)
+                        eval_futures.append(
+                            eval_pool.submit(
+                                _evaluation_worker,
+                                player1,
+                                player2,
+                                environment,
+                                num_eval_episodes,
+                                max_step,
+                                illegal_move,
+                                int(seeds.integers(2**32)),
+                            )
+                        )
+        except KeyboardInterrupt:
+            pass
+        results = [future.result() for future in eval_futures]
+
+    all_rewards = np.array([rewards for rewards, _ in results]).T
+    winners = np.array([winners_list for _, winners_list in results]).T
+    return episodes, all_rewards, winners
+
+
 def visualize_rewards(
     episodes: list,
     all_rewards: np.ndarray,
@@ -157,6 +714,7 @@ def visualize_rewards(
     name2: str = None,
     from_index: int = 0,
     end_index: int = -1,
+    block: bool = True,
 ):
     """Reward visualization for the evaluation during training
 
@@ -171,6 +729,8 @@ def visualize_rewards(
                                 it will be `Player 2`
         from_index (int, optional): start index. Defaults to 0.
         end_index (int, optional): end index. Defaults to -1.
+        block (bool, optional): flag saying wether showing the figure blocks until it is closed.
+                                Defaults to True.
     """
     if not name1:
         name1 = "Player 1"
@@ -193,7 +753,7 @@ def visualize_rewards(
         label=name2,
     )
     plt.legend()
-    plt.show()
+    plt.show(block=block)
 
 
 def visuzalize_winners(
@@ -203,6 +763,7 @@ def visuzalize_winners(
     name2: str = None,
     from_index: int = 0,
     end_index: int = -1,
+    block: bool = True,
 ):
     """Histogram visualization of number episode time players win for each evaluation
 
@@ -216,6 +777,8 @@ def visuzalize_winners(
                                 it will be `Player 2`
         from_index (int, optional): start index. Defaults to 0.
         end_index (int, optional): end index. Defaults to -1.
+        block (bool, optional): flag saying wether showing the figure blocks until it is closed.
+                                Defaults to True.
 
     Returns:
         str: percentage of draw and winning time of both players
@@ -230,9 +793,48 @@ def visuzalize_winners(
     plt.hist(winners[2][from_index:end_index], label=name2)
     plt.hist(winners[0][from_index:end_index], label="Draw")
     plt.legend()
-    plt.show()
+    plt.show(block=block)
 
     draw, p1, p2 = (
         np.mean(winners[:, from_index:end_index], axis=-1) * 100 / num_eval_episodes
     )
     return f"{draw:.2f}% is Draw\n{p1:.2f}% {name1} wins\n{p2:.2f}% {name2} wins"
+
+
+def visualize_metrics(
+    metrics_path: str,
+    name1: str = None,
+    name2: str = None,
+    max_points: int = 1000,
+    from_episode: int = 0,
+    end_episode: int = None,
+    block: bool = False,
+):
+    """Rewards and winners visualization from a metrics log written by `train`.
+
+    The log is read lazily and downsampled, so logs of long trainings can be charted
+    without loading all their rows.
+
+    Args:
+        metrics_path (str): path of the metrics log
+        name1 (str, optional): name of player 1. Defaults to None. If None is given,
+                                it will be `Player 1`
+        name2 (str, optional): name of player 2. Defaults to None. If None is given,
+                                it will be `Player 2`
+        max_points (int, optional): maximum number of points of each curve (see `read_metrics`).
+                                Defaults to 1000.
+        from_episode (int, optional): first training episode to chart. Defaults to 0.
+        end_episode (int, optional): training episode where to stop (excluded). Defaults to None.
+        block (bool, optional): flag saying wether showing the figures blocks until they are closed.
+                                Defaults to False.
+
+    Returns:
+        str: percentage of draw and winning time of both players
+    """
+    episodes, all_rewards, winners, num_eval_episodes = read_metrics(
+        metrics_path, max_points, from_episode, end_episode
+    )
+    visualize_rewards(
+        episodes, all_rewards, num_eval_episodes, name1, name2, 0, None, block
+    )
+    return visuzalize_winners(winners, num_eval_episodes, name1, name2, 0, None, block)
@@ -1,7 +1,60 @@
 import numpy as np
 import json
+from functools import lru_cache
 from typing import *
 
+NUM_CELLS = 9
+NUM_STATES = 3**NUM_CELLS
+
+
+def state_to_code(state: str):
+    """Convert a hashed state into its integer code.
+
+    The hashed state is read as a base-3 number, the first cell being the most
+    significant digit, so that every board has a unique code in `[0, 3**9)`.
+
+    Args:
+        state (str): hashed state (e.g. `'100020000'`)
+
+    Returns:
+        int: integer code of the state
+    """
+    return int(state, 3)
+
+
+@lru_cache(maxsize=None)
+def code_to_state(code: int):
+    """Convert an integer state code back into its hashed state.
+
+    Args:
+        code (int): integer code of the state (see `state_to_code`)
+
+    Returns:
+        str: hashed state
+    """
+    digits = []
+    for _ in range(NUM_CELLS):
+        code, digit = divmod(code, 3)
+        digits.append(str(digit))
+    return "".join(reversed(digits))
+
+
+def code_to_cells(code: int, num_cells: int = NUM_CELLS):
+    """Convert an integer state code of any board size into its cells.
+
+    Args:
+        code (int): integer code of the state (base-3 number, the first cell being the
+                    most significant digit)
+        num_cells (int, optional): number of cells of the board. Defaults to `NUM_CELLS`.
+
+    Returns:
+        list[int]: cells of the state (0 for empty, 1 for player 1 and 2 for player 2)
+    """
+    cells = [0] * num_cells
+    for cell in range(num_cells - 1, -1, -1):
+        code, cells[cell] = divmod(code, 3)
+    return cells
+
 
 def softmax(logits: np.ndarray):
     """Compute the softmax of a logits.
@@ -16,16 +69,20 @@ def softmax(logits: np.ndarray):
     return exp_logits / np.sum(exp_logits)
 
 
-def argmax_uniform(qvalue: np.ndarray):
+def argmax_uniform(qvalue: np.ndarray, sampler=None):
     """Argmax function where the index will be chosen uniformely if there are more than one max
 
     Args:
         qvalue (np.ndarray): a 1-d array argument for the argmax function
+        sampler (Sampler, optional): sampler used to break ties. Defaults to None.
+                                    If None is given, `np.random` is used.
 
     Returns:
         int: argmax chosen uniformely from all maximum
     """
     idx_max = np.arange(qvalue.shape[0])[qvalue == qvalue.max()]
+    if sampler is not None:
+        return int(idx_max[sampler.integers(len(idx_max))])
     return np.random.choice(idx_max)
 
 
@@ -67,6 +124,56 @@ def return_probabilities(state: str, qvalue_state: np.ndarray, kind: str):
     return probs.tolist()
 
 
+def states_to_matrix(states: Sequence[str]):
+    """Convert hashed states into a matrix of cells.
+
+    Args:
+        states (Sequence[str]): hashed states
+
+    Returns:
+        np.ndarray: `(S, 9)` array where row `i` holds the cells (0, 1 or 2) of `states[i]`
+    """
+    content = "".join(states).encode()
+    return (np.frombuffer(content, dtype=np.uint8) - ord("0")).reshape(-1, NUM_CELLS)
+
+
+def return_probabilities_batch(
+    states_matrix: np.ndarray, q_matrix: np.ndarray, kind: str
+):
+    """Generate probability distributions of actions at many states at once, knowing their Q-values.
+
+    Row `i` of the result is the same as `return_probabilities` for the state of row `i`
+    of `states_matrix` and the Q-value of row `i` of `q_matrix`.
+
+    Args:
+        states_matrix (np.ndarray): `(S, 9)` array of cells of the states (see `states_to_matrix`)
+        q_matrix (np.ndarray): `(S, 9)` array of the Q-values at the states
+        kind (str): one of the strings `'random'`, `'greedy'` or `'softmax'` which will be used to define the probability.
+
+    Raises:
+        NotImplementedError: raise Error if kind is not one of `'random'`, `'greedy'` and `'softmax'`
+
+    Returns:
+        np.ndarray: `(S, 9)` array of the policy distributions at the states
+    """
+    legal = np.asarray(states_matrix) == 0
+    masked = np.where(legal, q_matrix, -np.inf)
+    row_max = masked.max(axis=-1, keepdims=True)
+    row_max[~np.isfinite(row_max)] = 0  # filled boards
+    if kind == "greedy":
+        weights = (legal & (masked == row_max)).astype(float)
+    elif kind == "softmax":
+        weights = np.exp(masked - row_max)
+    elif kind == "random":
+        weights = legal.astype(float)
+    else:
+        raise NotImplementedError
+    total = weights.sum(axis=-1, keepdims=True)
+    probs = np.divide(weights, total, out=np.zeros_like(weights), where=total > 0)
+    probs[total[:, 0] == 0, 0] = 1
+    return probs
+
+
 def generate_json(data: dict, json_path: str):
     """Generate a json file of the policy dictionary
 
@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import *
+
+from back.tictactoe import TicTacToe, BitboardTicTacToe, BatchTicTacToe
+from back.player_module import QAgent
+from back.train_module import run_episode, run_episodes_batched, evaluate, train
+from back.solver import evaluate_against_oracle
+from back.utils import read_json, generate_json
+
+QVALUE_PATH = "./src/qvalue/qvalue_player1.json"
+HISTORY_PATH = "./benchmarks/history.json"
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, unit: str, higher_is_better: bool = True, slow: bool = False):
+    """Register a benchmark function returning the measured value.
+
+    Args:
+        name (str): name of the benchmark
+        unit (str): unit of the measured value
+        higher_is_better (bool, optional): flag saying wether a higher value is an improvement
+                                            (throughput) or a regression (latency). Defaults to True.
+        slow (bool, optional): flag saying wether the benchmark only runs with `--all`.
+                                Defaults to False.
+    """
+
+    def register(function: Callable[[int], float]):
+        BENCHMARKS[name] = {
+            "function": function,
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+            "slow": slow,
+        }
+        return function
+
+    return register
+
+
+def best_time(function: Callable[[], Any], repeat: int):
+    """Smallest running time of a function among several runs (in seconds)."""
+    return timed(function, repeat)[0]
+
+
+def timed(function: Callable[[], Any], repeat: int):
+    """Smallest running time of a function among several runs (in seconds) and
+    the output of the function during this run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, output)
+    return best
+
+
+def new_agent(epsilon: float = 0.3):
+    return QAgent(9, gamma=0.9, learning_rate=0.5, epsilon=epsilon, dense=True)
+
+
+def random_games(environment: TicTacToe, num_games: int):
+    """Play random games with allowed actions and return the number of steps."""
+    num_steps = 0
+    for _ in range(num_games):
+        environment.reset()
+        while not environment.end:
+            actions = environment.legal_actions()
+            environment.step(actions[np.random.randint(len(actions))])
+            num_steps += 1
+    return num_steps
+
+
+@benchmark("tictactoe_step", "steps/s")
+def bench_tictactoe_step(repeat: int):
+    environment = TicTacToe()
+    elapsed, num_steps = timed(lambda: random_games(environment, 1000), repeat)
+    return num_steps / elapsed
+
+
+@benchmark("bitboard_step", "steps/s")
+def bench_bitboard_step(repeat: int):
+    environment = BitboardTicTacToe()
+    elapsed, num_steps = timed(lambda: random_games(environment, 1000), repeat)
+    return num_steps / elapsed
+
+
+@benchmark("run_episode", "episodes/s")
+def bench_run_episode(repeat: int):
+    num_episodes = 500
+    player1, player2 = new_agent(), new_agent()
+    environment = BitboardTicTacToe()
+
+    def episodes():
+        for _ in range(num_episodes):
+            run_episode(player1, player2, environment)
+
+    return num_episodes / best_time(episodes, repeat)
+
+
+@benchmark("run_episodes_batched", "episodes/s")
+def bench_run_episodes_batched(repeat: int):
+    num_episodes = 5000
+    player1, player2 = new_agent(), new_agent()
+    environment = BatchTicTacToe(1024)
+    elapsed = best_time(
+        lambda: run_episodes_batched(player1, player2, environment, num_episodes),
+        repeat,
+    )
+    return num_episodes / elapsed
+
+
+@benchmark("qagent_act", "us/call", higher_is_better=False)
+def bench_qagent_act(repeat: int):
+    agent = new_agent(epsilon=0.5)
+    states = list(read_json(QVALUE_PATH))[:2000]
+    for state in states:
+        agent.act(state)  # insert the states before timing
+
+    def act():
+        for state in states:
+            agent.act(state)
+
+    return 1e6 * best_time(act, repeat) / len(states)
+
+
+@benchmark("qagent_update", "us/call", higher_is_better=False)
+def bench_qagent_update(repeat: int):
+    agent = new_agent()
+    states = list(read_json(QVALUE_PATH))[:2000]
+    transitions = [
+        (state, state.index("0"), next_state, 0, False)
+        for state, next_state in zip(states, states[1:])
+        if "0" in state
+    ]
+
+    def update():
+        for transition in transitions:
+            agent.update(*transition)
+
+    return 1e6 * best_time(update, repeat) / len(transitions)
+
+
+@benchmark("generate_policy", "ms", higher_is_better=False)
+def bench_generate_policy(repeat: int):
+    qfunction = read_json(QVALUE_PATH, return_as_array=True)
+
+    def generate():
+        for kind in ("greedy", "softmax"):
+            agent = QAgent(9, 0.9, 0.5, 0.3, qfunction=qfunction)
+            agent.generate_policy(kind)
+
+    return 1e3 * best_time(generate, repeat) / 2
+
+
+@benchmark("read_json", "ms", higher_is_better=False)
+def bench_read_json(repeat: int):
+    return 1e3 * best_time(lambda: read_json(QVALUE_PATH, return_as_array=True), repeat)
+
+
+@benchmark("generate_json", "ms", higher_is_better=False)
+def bench_generate_json(repeat: int):
+    qfunction = read_json(QVALUE_PATH, return_as_array=True)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "qvalue.json")
+        return 1e3 * best_time(lambda: generate_json(qfunction, path), repeat)
+
+
+@benchmark("convergence", "optimal rate", slow=True)
+def bench_convergence(repeat: int):
+    """Fraction of optimal greedy actions of agents trained on 20000 episodes of self-play."""
+    np.random.seed(0)
+    player1, player2 = new_agent(), new_agent()
+    train(player1, player2, BitboardTicTacToe(), 20000, 5000, 100)
+    return (
+        evaluate_against_oracle(player1.qfunction, 1)["optimal_rate"]
+        + evaluate_against_oracle(player2.qfunction, 2)["optimal_rate"]
+    ) / 2
+
+
+def trace_score(trace_decay: float, seed: int, num_episodes: int = 2000):
+    """Greedy score (mean reward over 1000 games) of an agent trained on `num_episodes`
+    episodes as first player against a uniformly random opponent."""
+    np.random.seed(seed)
+    environment = BitboardTicTacToe()
+    agent = new_agent()
+    agent.trace_decay = trace_decay
+    # its values stay uniform on allowed actions, so its greedy moves are random
+    opponent = QAgent(9, gamma=0.9, learning_rate=0.0, epsilon=0.0)
+    for _ in range(num_episodes):
+        run_episode(agent, opponent, environment)
+    rewards, _ = evaluate(agent, opponent, environment, 1000)
+    return rewards[0]
+
+
+@benchmark("trace_gain", "score", slow=True)
+def bench_trace_gain(repeat: int):
+    """Gain of the greedy score of Q(lambda) (`trace_decay=0.8`) over one-step Q-learning
+    against a random opponent, averaged over 4 seeds."""
+    return np.mean(
+        [trace_score(0.8, seed) - trace_score(0.0, seed) for seed in range(4)]
+    )
+
+
+# minimum values a run should reach (measured values below them are reported)
+TARGETS = {"convergence": 0.5, "trace_gain": 0.0}
+
+
+def run(names: Iterable[str] = None, repeat: int = 5, include_slow: bool = False):
+    """Run benchmarks.
+
+    Args:
+        names (Iterable[str], optional): names of the benchmarks to run. Defaults to None.
+                                        If None is given, every benchmark is run (except the
+                                        slow ones if `include_slow` is False).
+        repeat (int, optional): number of timed runs, the best one is kept. Defaults to 5.
+        include_slow (bool, optional): flag saying wether slow benchmarks are run. Defaults to False.
+
+    Returns:
+        dict: value, unit and direction of each benchmark
+    """
+    if names is None:
+        names = [
+            name
+            for name, case in BENCHMARKS.items()
+            if include_slow or not case["slow"]
+        ]
+    results = {}
+    for name in names:
+        case = BENCHMARKS[name]
+        value = float(case["function"](repeat))
+        results[name] = {
+            "value": value,
+            "unit": case["unit"],
+            "higher_is_better": case["higher_is_better"],
+        }
+        line = f"{name:<20}{value:>14.3f} {case['unit']}"
+        if name in TARGETS and value < TARGETS[name]:
+            line += f"  (below target {TARGETS[name]})"
+        print(line)
+    return results
+
+
+def _commit():
+    """Short hash of the current git commit, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path: str = HISTORY_PATH):
+    """List of the recorded runs (oldest first)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as history_file:
+        return json.load(history_file)
+
+
+def record(results: dict, path: str = HISTORY_PATH):
+    """Append the results of a run to the history file.
+
+    Args:
+        results (dict): results returned by `run`
+        path (str, optional): path of the history file. Defaults to `HISTORY_PATH`.
+    """
+    history = read_history(path)
+    history.append(
+        {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "results": results,
+        }
+    )
+    with open(path, "w") as history_file:
+        json.dump(history, history_file, indent=2)
+
+
+def compare(
+    path: str = HISTORY_PATH, base: int = -2, current: int = -1, threshold: float = 0.1
+):
+    """Compare two runs of the history file and report regressions.
+
+    Args:
+        path (str, optional): path of the history file. Defaults to `HISTORY_PATH`.
+        base (int, optional): index of the reference run. Defaults to -2 (previous run).
+        current (int, optional): index of the compared run. Defaults to -1 (last run).
+        threshold (float, optional): relative slowdown considered as a regression. Defaults to 0.1.
+
+    Returns:
+        list[str]: names of the regressed benchmarks
+    """
+    history = read_history(path)
+    if len(history) < 2:
+        print("At least two runs are needed to compare.")
+        return []
+    base_run, current_run = history[base], history[current]
+    print(f"base: {base_run['commit']} ({base_run['time']})")
+    print(f"current: {current_run['commit']} ({current_run['time']})\n")
+    regressions = []
+    for name, result in current_run["results"].items():
+        if name not in base_run["results"]:
+            continue
+        old, new = base_run["results"][name]["value"], result["value"]
+        change = (new - old) / old if old else 0.0
+        if not result["higher_is_better"]:
+            change = -change  # positive change is always an improvement
+        status = ""
+        if change < -threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<20}{old:>14.3f}{new:>14.3f} {result['unit']:<14}{change:>+8.1%} {status}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the training code.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks and record them")
+    run_parser.add_argument(
+        "names", nargs="*", metavar="NAME", help=", ".join(BENCHMARKS)
+    )
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument(
+        "--all", action="store_true", help="include slow benchmarks"
+    )
+    run_parser.add_argument("--no-record", action="store_true")
+    run_parser.add_argument("--history", default=HISTORY_PATH)
+
+    compare_parser = commands.add_parser("compare", help="compare two recorded runs")
+    compare_parser.add_argument("--base", type=int, default=-2)
+    compare_parser.add_argument("--current", type=int, default=-1)
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--history", default=HISTORY_PATH)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        unknown = [name for name in args.names if name not in BENCHMARKS]
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+        results = run(args.names or None, args.repeat, args.all)
+        if not args.no_record:
+            record(results, args.history)
+    else:
+        regressions = compare(args.history, args.base, args.current, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
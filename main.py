@@ -1,30 +1,69 @@
-from back.tictactoe import TicTacToe
-from back.player_module import QAgent
-from back.utils import read_json, return_probabilities
-
+from back.tictactoe import BitboardTicTacToe
+from back.k_in_a_row import KInARow
+from back.player_module import QAgent, MCTSPlayer
+from back.state_graph import get_state_graph
+from back.persistence import PersistenceService
+from back.sampler import Sampler
+from back.policy_cache import get_policy_cache, cpu_level, level_source
+
+import time
 import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import *
 
 from kivymd.app import MDApp
 from kivy.lang import Builder
 from kivy.uix.widget import Widget
+from kivy.uix.button import Button
 from kivy.clock import Clock
+from kivy.logger import Logger
 
 
 Builder.load_file("./front/main.kv")
 
 
+def parse_board_size(text: str):
+    """Size and number of aligned marks to win of a board given as `'N'` or `'NxK'`.
+
+    Args:
+        text (str): board size, e.g. `'3'`, `'7x4'` or `'15x5'` (`'N'` means `'Nx3'`,
+                    `'Nx5'` from 5 on)
+
+    Returns:
+        tuple[int, int]: size and k, or None if the text is not a valid board size
+    """
+    size, _, k = text.lower().replace(" ", "").partition("x")
+    if not size.isdigit() or (k and not k.isdigit()):
+        return None
+    size = int(size)
+    k = int(k) if k else (3 if size < 5 else 5)
+    if not 1 <= k <= size <= 20:
+        return None
+    return size, k
+
+
 class TicTacToeLayout(Widget):
     def __init__(self, **kwargs):
         """Tic Tac Toe main widget"""
 
         super().__init__(**kwargs)
-        self.game = TicTacToe()
-        self.ids.textup.text = "Set names (cpu1/cpu2/cpu3 for cpu)"
+        self.game = BitboardTicTacToe()
+        self.board_size = 3
+        self.buttons = []
+        self.build_grid()
+        self.ids.textup.text = "Set names (cpu0 to cpu5 for cpu)"
         self.symbols = ["X", "O"]
         self.players_name = ["player1", "player2"]
         self._cpu = [False, False]
         self._agents = [None, None]
+        self.persistence = PersistenceService()
+        self.sampler = Sampler()
+        self.think_time = 0.3  # thinking time (in seconds) of the search level (cpu5)
+        self.move_delay = 0.5  # minimum time (in seconds) before a cpu move is shown
+        # cpu moves and agent updates run one at a time on this worker, off the UI thread
+        self.cpu_worker = ThreadPoolExecutor(max_workers=1)
+        self._generation = 0  # incremented to cancel the pending cpu move
+        self._pending = None  # future of the pending cpu move
 
     @property
     def game_over(self):
@@ -42,27 +81,28 @@ class TicTacToeLayout(Widget):
     def winner(self):
         return self.game.winner
 
-    def color_board(self, i: int):
-        """Coloring the coresponding winning boxes to be green
-
-        Args:
-            i (int): index of winning boxes
-        """
+    @property
+    def classic(self):
+        """Whether the game is tic tac toe, the game where the cpu agents were trained."""
+        return isinstance(self.game, BitboardTicTacToe)
+
+    def build_grid(self):
+        """Create the buttons of the cells of the board."""
+        grid = self.ids.grid
+        grid.clear_widgets()
+        grid.cols = grid.rows = self.board_size
+        self.buttons = []
+        for action in range(self.board_size * self.board_size):
+            button = Button(font_size=90 * 3 / self.board_size)
+            button.bind(on_press=lambda _, action=action: self.press(action))
+            grid.add_widget(button)
+            self.buttons.append(button)
+
+    def color_board(self):
+        """Coloring the winning boxes to be green"""
         color = (0, 1, 0, 1)  # Green
-        if i < 3:  # row
-            row = i
-            for col in range(3):
-                self.ids[f"bt{row}{col}"].background_color = color
-        elif i < 6:  # col
-            col = i - 3
-            for row in range(3):
-                self.ids[f"bt{row}{col}"].background_color = color
-        elif i == 6:  # diag
-            for row_col in range(3):
-                self.ids[f"bt{row_col}{row_col}"].background_color = color
-        elif i == 7:  # antidiag
-            for row in range(3):
-                self.ids[f"bt{row}{2-row}"].background_color = color
+        for cell in self.game.winning_cells:
+            self.buttons[cell].background_color = color
 
     def play_update_screen(self, row: int, col: int):
         """Update screen after playing at a given position
@@ -72,7 +112,7 @@ class TicTacToeLayout(Widget):
             col (int): col position where current player plays
         """
         symb = self.symbols[0] if self.hand_index == -1 else self.symbols[1]
-        self.ids[f"bt{row}{col}"].text = symb
+        self.buttons[row * self.board_size + col].text = symb
         hand = self.players_name[self.hand]
         self.ids.textup.text = f"{hand}'s turn"
 
@@ -82,25 +122,28 @@ class TicTacToeLayout(Widget):
         self.ids.numEmpty.text = (
             f"Empty : {num_empty}" if num_empty and not self.game_over else "Game over"
         )
-        color = num_empty / 9 if not self.game_over else 0
+        color = num_empty / self.game.num_actions if not self.game_over else 0
         self.ids.numEmpty.background_color = (color, color, color, 1)
         self.ids.numEmpty.color = (1 - color, 0, color * (1 - color), 1)
 
-    def update_save_agent(self, state, action, reward, done, hand):
-        next_state = self.game.hashed_state
-        self._agents[hand].update(state, action, next_state, reward, done)
+    def update_save_agent(self, agent, state, action, next_state, reward, done, hand):
+        """Update a cpu Q-agent after its move and save it at the end of the game
+        (runs on the cpu worker)."""
+        agent.update(state, action, next_state, reward, done)
         if done:
             path_qfunction = f"src/qvalue/qvalue_player{hand+1}.json"
-            path_policy = f"src/policy/expert_player{hand+1}.json"
-            self._agents[hand].save_qfunction(path_qfunction)
-            self._agents[hand].generate_policy("greedy", path_policy)
+            path_policy = f"src/policy/expert_player{hand+1}.qtab"
+            qfunction = agent.copy_qfunction()  # saved in background from a snapshot
+            self.persistence.submit(path_qfunction, qfunction.to_dict)
+            try:  # only the rows of the states updated since the last game are patched
+                agent.generate_policy("greedy", path_policy, incremental=True)
+            except (OSError, ValueError):
+                Logger.exception(f"TicTacToe: failed to save {path_policy}")
 
     def print_result(self):
         if self.winner is not None:
             winner = self.players_name[self.winner]
-            for i, val in enumerate(self.game.color):
-                if not val == 0:
-                    self.color_board(i)
+            self.color_board()
             self.ids.textup.text = f"{winner} wins!"
         else:
             winner = None
@@ -117,9 +160,18 @@ class TicTacToeLayout(Widget):
         state = self.game.hashed_state
         valid_move, reward = self.game.play(row, col)
         done = self.game_over
-        action = 3 * row + col
-        if isinstance(self._agents[hand], QAgent):
-            self.update_save_agent(state, action, reward, done, hand)
+        action = row * self.board_size + col
+        if isinstance(self._agents[hand], QAgent) and self.classic:
+            self.cpu_worker.submit(
+                self.update_save_agent,
+                self._agents[hand],
+                state,
+                action,
+                self.game.hashed_state,
+                reward,
+                done,
+                hand,
+            )
 
         if valid_move:
             self.play_update_screen(row, col)
@@ -130,23 +182,99 @@ class TicTacToeLayout(Widget):
             # self.add_stats(winner=winner)
 
         elif self._cpu[self.hand]:
-            Clock.schedule_once(lambda dt: self.auto_play(), 0.5)
+            self.auto_play()
+
+    def play_action(self, action: int):
+        """Let current player to play at the given cell if the move is allowed.
+
+        Args:
+            action (int): index of the cell where player want to play
+        """
+        self.play(*self.game.actions[action])
+
+    def press(self, action: int):
+        """Play at a pressed cell, unless it is the turn of a cpu player.
+
+        Args:
+            action (int): index of the pressed cell
+        """
+        if not self._cpu[self.hand]:
+            self.play_action(action)
+
+    def choose_action(self, player, state, environment):
+        """Compute the move of a cpu player (runs on the cpu worker).
+
+        Args:
+            player (MCTSPlayer | QAgent | Mapping): the cpu agent or policy
+            state (str | int): current state
+            environment (BitboardTicTacToe | KInARow): copy of the game at the current state
+
+        Returns:
+            int: the action of the cpu player
+        """
+        if isinstance(player, MCTSPlayer):  # tree search, on any board
+            player.environment = environment
+            player.time_budget = 1000 * self.think_time
+            return player.act(state)
+        if not isinstance(environment, BitboardTicTacToe):  # cpu0 to cpu4 play randomly
+            actions = environment.legal_actions()
+            return actions[self.sampler.integers(len(actions))]
+        if isinstance(player, Mapping):  # policy
+            if state in player:
+                return self.sampler.categorical(player.cdf(state))
+            return get_state_graph().sample_action(state, self.sampler)
+        return player.act(state=state, eval=True)  # Qagent
 
     def auto_play(self):
-        """Ask cpu agent to play"""
+        """Ask cpu agent to play.
 
-        state = self.game.hashed_state
-        player = self._agents[self.hand]
-        if isinstance(player, dict):  # policy
-            p = return_probabilities(
-                state, np.zeros(self.game.num_actions), kind="random"
+        The move is computed on the cpu worker and played on the UI thread after at least
+        `move_delay` seconds. Only one cpu move is pending at a time, and moves which were
+        requested before a restart (or a change of player or board) are dropped.
+        """
+        if self.game_over or self._pending is not None:
+            return
+        generation = self._generation
+        requested = time.perf_counter()
+        self._pending = self.cpu_worker.submit(
+            self.choose_action,
+            self._agents[self.hand],
+            self.game.hashed_state,
+            self.game.clone(),
+        )
+
+        def schedule(future: Future):  # called on the worker thread
+            delay = self.move_delay - (time.perf_counter() - requested)
+            Clock.schedule_once(
+                lambda dt: self.cpu_played(future, generation), max(0, delay)
             )
-            probs = player.get(state, p)
-            action = np.random.choice(self.game.num_actions, p=probs)
-        else:  # Qagent
-            action = player.act(state=state, eval=True)
-        row, col = self.game.actions[action]
-        self.play(row, col)
+
+        self._pending.add_done_callback(schedule)
+
+    def cpu_played(self, future: Future, generation: int):
+        """Play the move computed by the cpu worker if it was not cancelled meanwhile.
+        If the computation failed, the error is logged and a random allowed move is played.
+
+        Args:
+            future (Future): future of the move
+            generation (int): generation of the game when the move was requested
+        """
+        if generation != self._generation:
+            return
+        self._pending = None
+        error = future.exception()
+        if error is None:
+            action = future.result()
+        else:
+            Logger.exception("TicTacToe: cpu move failed", exc_info=error)
+            actions = self.game.legal_actions()
+            action = actions[self.sampler.integers(len(actions))]
+        self.play_action(action)
+
+    def cancel_cpu_move(self):
+        """Drop the pending cpu move, if any."""
+        self._generation += 1
+        self._pending = None
 
     def add_stats(self, winner: str):
         """Add statistic in the stats data.
@@ -168,37 +296,38 @@ class TicTacToeLayout(Widget):
         new_name = self.ids[f"player{player_n}"].text.strip()[:max_name_length]
 
         self.ids[f"player{player_n}"].text = new_name
+        # the pending move was requested for the old player
+        if self.hand == player_n - 1:
+            self.cancel_cpu_move()
         if new_name:
             self.players_name[player_n - 1] = new_name
         else:
             self.players_name[player_n - 1] = f"player{player_n}"
 
-        if (
-            "cpu" == new_name[:3].lower()
-            and len(new_name) == 4
-            and new_name[-1] in "0123"
-        ):
+        lvl = cpu_level(new_name)
+        if lvl is not None:
             self._cpu[player_n - 1] = True
-            lvl = new_name[-1]
 
-            if lvl == "3":
-                self._cpu[player_n - 1] = True
-                qfunction = read_json(
-                    f"./src/qvalue/qvalue_player{player_n}.json", return_as_array=True
+            if lvl == "5":
+                self._agents[player_n - 1] = MCTSPlayer(
+                    self.game, time_budget=1000 * self.think_time, sampler=self.sampler
                 )
+
+            elif lvl == "3":
+                loaded = get_policy_cache().get(*level_source(player_n, lvl))
                 self._agents[player_n - 1] = QAgent(
                     num_actions=9,
                     gamma=0.999,
                     learning_rate=0.9,
                     epsilon=1,
-                    qfunction=qfunction,
+                    qfunction=loaded.copy(),  # the cached table is shared
+                    dense=True,
+                    sampler=self.sampler,
                 )
 
-            elif lvl in "012":  # policy
-                level = {0: "easy", 1: "medium", 2: "hard"}[int(lvl)]
-                player = "" if level == "easy" else f"_player{player_n}"
-                self._agents[player_n - 1] = read_json(
-                    f"./src/policy/{level}{player}.json"
+            else:  # policy (solver's policy for level 4)
+                self._agents[player_n - 1] = get_policy_cache().get(
+                    *level_source(player_n, lvl)
                 )
 
             if self.hand == player_n - 1:
@@ -210,6 +339,16 @@ class TicTacToeLayout(Widget):
             hand = self.players_name[self.hand]
             self.ids.textup.text = f"{hand}'s turn"
 
+    def typing_name(self, player_n: int):
+        """Start loading the policy of a cpu level in the background while its name is typed.
+
+        Args:
+            player_n (int): index (1 or 2) of player
+        """
+        lvl = cpu_level(self.ids[f"player{player_n}"].text.strip())
+        if lvl is not None and lvl != "5":
+            get_policy_cache().preload(*level_source(player_n, lvl))
+
     def entered_symbol(self, player_n):
         """Edit all the symbols for corresponding player
 
@@ -218,13 +357,14 @@ class TicTacToeLayout(Widget):
         """
         new_symbol = self.ids[f"symbol{player_n}"].text
         player_val = 1 if player_n == 1 else -1
-        for row in range(3):
-            for col in range(3):
-                if self.game.board[row][col] == player_val:
+        for row, values in enumerate(self.game.board):
+            for col, value in enumerate(values):
+                if value == player_val:
+                    button = self.buttons[row * self.board_size + col]
                     if new_symbol != "":
-                        self.ids[f"bt{row}{col}"].text = new_symbol
+                        button.text = new_symbol
                     else:
-                        self.ids[f"bt{row}{col}"].text = "X" if player_n == 1 else "O"
+                        button.text = "X" if player_n == 1 else "O"
         if new_symbol != "":
             self.symbols[player_n - 1] = new_symbol
         else:
@@ -232,10 +372,10 @@ class TicTacToeLayout(Widget):
 
     def restart(self):
         """Restart the game from the begining."""
-        for row in range(3):
-            for col in range(3):
-                self.ids[f"bt{row}{col}"].text = ""
-                self.ids[f"bt{row}{col}"].background_color = (1, 1, 1, 1)
+        self.cancel_cpu_move()
+        for button in self.buttons:
+            button.text = ""
+            button.background_color = (1, 1, 1, 1)
         self.game.reset()
         self.ids.textup.text = "Start"
         self.ids.numEmpty.text = ""
@@ -243,11 +383,34 @@ class TicTacToeLayout(Widget):
         if self._cpu[self.hand]:
             self.auto_play()
 
+    def entered_size(self):
+        """Set the board from the interface (`N` or `NxK`: `N x N` board where `K` aligned
+        marks win) and restart the game. In other games than 3x3, cpu0 to cpu4 play randomly.
+        """
+        parsed = parse_board_size(self.ids.boardSize.text)
+        if parsed is None:
+            self.ids.boardSize.text = f"{self.board_size}x{getattr(self.game, 'k', 3)}"
+            return
+        size, k = parsed
+        self.ids.boardSize.text = f"{size}x{k}"
+        self.board_size = size
+        self.game = BitboardTicTacToe() if (size, k) == (3, 3) else KInARow(size, k)
+        for agent in self._agents:
+            if isinstance(agent, MCTSPlayer):
+                self.cpu_worker.submit(agent.reset)
+        self.build_grid()
+        self.restart()
+
 
 class TicTacToeAPP(MDApp):
     def build(self):
         return TicTacToeLayout()
 
+    def on_stop(self):
+        self.root.cancel_cpu_move()
+        self.root.cpu_worker.shutdown(wait=True)  # pending agent saves are submitted
+        self.root.persistence.close()
+
 
 if __name__ == "__main__":
     TicTacToeAPP().run()